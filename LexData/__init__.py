@@ -1,13 +1,25 @@
 # -*-coding:utf-8-*
-import json
 import logging
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
+from .asyncsession import AsyncWikidataSession
+from .cache import DiskCache, MemoryCache
 from .claim import Claim
-from .form import Form
-from .sense import Sense
+from .codec import JSONCodec, OrjsonCodec, default_codec
+from .editqueue import EditError, EditQueue
+from .entity import build_claims
+from .form import Form, build_form
+from .sense import Sense, build_sense
 from .language import Language
+from .lemmaindex import LemmaIndex
+from .metrics import Metrics
+from .mirror import LexemeMirror
 from .lexeme import Lexeme
+from .sparql import SparqlClient
+from .throttle import AdaptiveThrottle
 from .wikidatasession import WikidataSession
 
 
@@ -28,14 +40,155 @@ def get_or_create_lexeme(
     :rtype: Lexeme
 
     """
-    lexemes = search_lexemes(repo, lemma, lang, catLex)
-    if len(lexemes) == 1:
-        return lexemes[0]
-    elif len(lexemes) > 1:
+    ids = search_lexeme_ids(repo, lemma, lang, catLex)
+    if len(ids) == 1:
+        return Lexeme(repo, ids[0])
+    elif len(ids) > 1:
         logging.warning("Multiple lexemes found, using first one.")
-        return lexemes[0]
+        return Lexeme(repo, ids[0])
     else:
-        return create_lexeme(repo, lemma, lang, catLex)
+        lexeme_id, created = _create_once(repo, lemma, lang, catLex)
+        if created is not None:
+            return created
+        return Lexeme(repo, lexeme_id)
+
+
+@dataclass
+class LexemeResult:
+    """Outcome of get_or_create_lexemes() for one lemma"""
+
+    # "found", "created" or "ambiguous"
+    status: str
+    # Ids of the matching lexemes, one unless the status is "ambiguous"
+    ids: List[str]
+
+
+def get_or_create_lexemes(
+    repo: WikidataSession,
+    entries: Iterable[Tuple[str, Language, str]],
+    workers: int = 4,
+    sparql: Optional[SparqlClient] = None,
+) -> Dict[Tuple[str, str, str], LexemeResult]:
+    """Search for many lexemes and create the ones that don't exist yet.
+
+    The entries are deduplicated, the searches are sent in parallel, the
+    candidates of all searches are checked with batched requests and only
+    the missing lexemes are created. If more than one lexeme matches an entry
+    none is created and the entry is reported as ambiguous.
+
+    A lexeme is never created twice for the same entry by a session, even if
+    several threads call this function (or get_or_create_lexeme()) at the
+    same time – the search API takes a while until it finds new lexemes. The
+    session remembers the last WikidataSession.max_created lexemes it
+    created for that. Other sessions and processes don't know about them, so
+    they are not protected from creating the same lexeme.
+
+    :param repo: Wikidata Session
+    :type  repo: WikidataSession
+    :param entries: (lemma, language, lexical category) of the lexemes
+    :type  entries: Iterable[Tuple[str, Language, str]]
+    :param workers: Number of requests to send in parallel
+    :type  workers: int
+    :param sparql: Resolve the entries with the query service instead of
+                   searching them one by one, see SparqlClient. Entries the
+                   query service doesn't find are still searched before they
+                   are created, since it lags behind the edits.
+    :type  sparql: Optional[SparqlClient]
+    :returns: The result by (lemma, language QID, lexical category)
+    :rtype: Dict[Tuple[str, str, str], LexemeResult]
+
+    """
+    languages: Dict[Tuple[str, str, str], Language] = {}
+    for lemma, lang, catLex in entries:
+        languages.setdefault((lemma, lang.qid, catLex), lang)
+    keys = list(languages)
+    index = repo.lemma_index
+
+    def search(key: Tuple[str, str, str]) -> Tuple[List[str], bool]:
+        # Candidates of a key and whether they are checked already
+        lemma, _, catLex = key
+        if index is not None:
+            ids = index.lookup(lemma, languages[key], catLex)
+            if ids:
+                return ids, True
+        DATA = repo.get(_search_params(lemma, languages[key]))
+        if "error" in DATA:
+            raise Exception(DATA["error"])
+        return _search_candidates(DATA, lemma, languages[key]), False
+
+    def create(key: Tuple[str, str, str]) -> Tuple[str, bool]:
+        lemma, _, catLex = key
+        lexeme_id, created = _create_once(repo, lemma, languages[key], catLex)
+        return lexeme_id, created is not None
+
+    results: Dict[Tuple[str, str, str], LexemeResult] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if sparql is not None:
+            resolved = sparql.resolve_lexemes(
+                (key[0], languages[key], key[2]) for key in keys
+            )
+            # The query service lags behind the edits, so entries it doesn't
+            # know are searched and checked like without it
+            searched = {key: (resolved[key], True) for key in keys if resolved[key]}
+            unknown = [key for key in keys if key not in searched]
+            searched.update(zip(unknown, executor.map(search, unknown)))
+        else:
+            searched = dict(zip(keys, executor.map(search, keys)))
+        unchecked = [
+            idLex
+            for candidates, checked in searched.values()
+            if not checked
+            for idLex in candidates
+        ]
+        entities = repo.fetch_parallel(unchecked, workers=workers, props=["info"])
+        if index is not None:
+            index.add(e for e in entities.values() if "lemmas" in e)
+        missing = []
+        for key, (candidates, checked) in searched.items():
+            ids = [
+                idLex
+                for idLex in candidates
+                if checked or _matches(entities[idLex], languages[key], key[2])
+            ]
+            if not ids:
+                missing.append(key)
+            elif len(ids) > 1:
+                logging.warning("Multiple lexemes found for %s: %s", key[0], ids)
+                results[key] = LexemeResult("ambiguous", ids)
+            else:
+                results[key] = LexemeResult("found", ids)
+        for key, (lexeme_id, created) in zip(missing, executor.map(create, missing)):
+            results[key] = LexemeResult("created" if created else "found", [lexeme_id])
+    return {key: results[key] for key in keys}
+
+
+def _create_once(
+    repo: WikidataSession, lemma: str, lang: Language, catLex: str
+) -> Tuple[str, Optional[Lexeme]]:
+    # Create a lexeme unless the session created it already. Returns its id
+    # and the Lexeme if it was created by this call.
+    key = (lemma, lang.qid, catLex)
+    with repo._created_lock:
+        lock = repo._creating.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            with repo._created_lock:
+                lexeme_id = repo._created.get(key)
+                if lexeme_id is not None:
+                    repo._created.move_to_end(key)
+                    return lexeme_id, None
+            lexeme = create_lexeme(repo, lemma, lang, catLex)
+            with repo._created_lock:
+                repo._created[key] = lexeme.id
+                if len(repo._created) > repo.max_created:
+                    repo._created.popitem(last=False)
+            return lexeme.id, lexeme
+    finally:
+        # Also if the lexeme was created before or the creation failed.
+        # Threads still waiting keep their reference to the lock.
+        with repo._created_lock:
+            if repo._creating.get(key) is lock:
+                del repo._creating[key]
 
 
 def search_lexemes(
@@ -55,6 +208,57 @@ def search_lexemes(
     :returns: List of Lexemes with the specified properties
     :rtype: List[Lexeme]
     """
+    ids = search_lexeme_ids(repo, lemma, lang, catLex)
+    return [lexeme for lexeme in Lexeme.get_many(repo, ids) if lexeme is not None]
+
+
+def search_lexeme_ids(
+    repo: WikidataSession, lemma: str, lang: Language, catLex: str
+) -> List[str]:
+    """
+    Search for the ids of lexemes by their label, language and lexical
+    category without loading the lexemes.
+
+    :param repo: Wikidata Session
+    :type  repo: WikidataSession
+    :param lemma: the lemma of the lexeme
+    :type  lemma: str
+    :param lang: language of the lexeme
+    :type  lang: Language
+    :param catLex: lexical Category of the lexeme
+    :type  catLex: str
+    :returns: List of ids of Lexemes with the specified properties
+    :rtype: List[str]
+    """
+    index = repo.lemma_index
+    if index is not None:
+        ids = index.lookup(lemma, lang, catLex)
+        if ids:
+            logging.info("Found lexemes in lemma index: %s", ids)
+            return ids
+
+    DATA = repo.get(_search_params(lemma, lang))
+
+    if "error" in DATA:
+        raise Exception(DATA["error"])
+
+    candidates = _search_candidates(DATA, lemma, lang)
+    if not candidates:
+        return []
+    # Language and lexical category are part of the basic information of a
+    # lexeme, so we don't need to download the claims for the check
+    entities = repo.get_entities(candidates, props=["info"])
+    ids = []
+    for idLex in candidates:
+        if _matches(entities[idLex], lang, catLex):
+            logging.info("Found lexeme: %s", idLex)
+            ids.append(idLex)
+    if index is not None:
+        index.add(entities[idLex] for idLex in ids if "lemmas" in entities[idLex])
+    return ids
+
+
+def _search_params(lemma: str, lang: Language) -> Dict[str, str]:
     # the language we specify in search is currently not used by the search
     # set it nevertheless, except if it is a Language without ISO code
     if lang.short[:3] == "mis":
@@ -62,7 +266,7 @@ def search_lexemes(
     else:
         searchlang = lang.short
 
-    PARAMS = {
+    return {
         "action": "wbsearchentities",
         "language": searchlang,
         "type": "lexeme",
@@ -71,32 +275,38 @@ def search_lexemes(
         "limit": "10",
     }
 
-    DATA = repo.get(PARAMS)
-
-    if "error" in DATA:
-        raise Exception(DATA["error"])
 
+def _search_candidates(DATA: Dict, lemma: str, lang: Language) -> List[str]:
     # Iterate over all results and check for matches. Do not rely on
     # match-results, since they can differ for smaller languages – use them
     # however to avoid unnecessary queries.
-    lexemes = []
+    candidates = []
     for item in DATA["search"]:
         if item["label"] == lemma:
             if "language" in item["match"]:
-                if item["match"]["language"] != lang.short and item["match"] != "und":
+                if item["match"]["language"] not in (lang.short, "und"):
                     continue
-            idLex = item["id"]
-            lexeme = Lexeme(repo, idLex)
-            if lexeme["language"] == lang.qid and lexeme["lexicalCategory"] == catLex:
-                logging.info("Found lexeme: %s", idLex)
-                lexemes.append(lexeme)
-    return lexemes
+            candidates.append(item["id"])
+    return candidates
+
+
+def _matches(entity: Dict, lang: Language, catLex: str) -> bool:
+    return (
+        entity.get("language") == lang.qid
+        and entity.get("lexicalCategory") == catLex
+    )
 
 
 def create_lexeme(
-    repo: WikidataSession, lemma: str, lang: Language, catLex: str, claims=None
+    repo: WikidataSession,
+    lemma: str,
+    lang: Language,
+    catLex: str,
+    claims: Optional[Union[List[Claim], Dict[str, List[str]]]] = None,
+    forms: Optional[List[Dict[str, Any]]] = None,
+    senses: Optional[List[Dict[str, Any]]] = None,
 ) -> Lexeme:
-    """Creates a lexeme
+    """Creates a lexeme, including its forms, senses and claims, with one edit
 
     :param repo: Wikidata Session
     :type  repo: WikidataSession
@@ -105,23 +315,52 @@ def create_lexeme(
     :param lang: language
     :type  lang: Language
     :param catLex: lexicographical category
-    :param claims: claims to add to the lexeme (Default value = None) -> Lexem)
     :type  catLex: str
+    :param claims: claims to add to the lexeme, see Entity.add_claims()
+    :param forms: forms to add to the lexeme, each given as dictionary of the
+                  arguments of Lexeme.create_form()
+
+                  Example: ``[{"form": "firsts", "infos_gram": ["Q146786"]}]``
+    :type  forms: Optional[List[Dict[str, Any]]]
+    :param senses: senses to add to the lexeme, each given as dictionary of
+                   the arguments of Lexeme.create_sense()
+
+                   Example: ``[{"glosses": {"en": "…"}, "claims": {"P5137": ["Q1"]}}]``
+    :type  senses: Optional[List[Dict[str, Any]]]
     :returns: The created Lexeme
     :rtype: Lexeme
 
     """
 
     # Create the json with the lexeme's data
-    data_lex = json.dumps(
-        {
-            "type": "lexeme",
-            "lemmas": {lang.short: {"value": lemma, "language": lang.short}},
-            "language": lang.qid,
-            "lexicalCategory": catLex,
-            "forms": [],
-        }
-    )
+    data: Dict[str, Any] = {
+        "type": "lexeme",
+        "lemmas": {lang.short: {"value": lemma, "language": lang.short}},
+        "language": lang.qid,
+        "lexicalCategory": catLex,
+        "forms": [],
+    }
+    if claims:
+        data["claims"] = build_claims(claims)
+    for form in forms or []:
+        form_lang = form.get("language") or lang
+        # New forms and senses have to be marked with "add"
+        data["forms"].append(
+            dict(
+                build_form(
+                    form["form"],
+                    form.get("infos_gram", []),
+                    form_lang.short,
+                    form.get("claims"),
+                ),
+                add="",
+            )
+        )
+    if senses:
+        data["senses"] = [
+            dict(build_sense(sense["glosses"], sense.get("claims")), add="")
+            for sense in senses
+        ]
 
     # Send a post to edit a lexeme
     PARAMS = {
@@ -130,17 +369,15 @@ def create_lexeme(
         "bot": "1",
         "new": "lexeme",
         "token": "__AUTO__",
-        "data": data_lex,
+        "data": repo.codec.dumps(data),
     }
 
     DATA = repo.post(PARAMS)
-    # Get the id of the new lexeme
-    idLex = DATA["entity"]["id"]
-
-    logging.info("Created lexeme: %s", idLex)
-    lexeme = Lexeme(repo, idLex)
+    # The answer contains the whole new lexeme
+    lexeme = Lexeme.from_dict(repo, DATA["entity"])
 
-    if claims:
-        lexeme.create_claims(claims)
+    logging.info("Created lexeme: %s", lexeme.id)
+    if repo.lemma_index is not None:
+        repo.lemma_index.add([lexeme])
 
     return lexeme
@@ -0,0 +1,419 @@
+import asyncio
+import logging
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional, Union, cast
+
+from .claim import Claim
+from .codec import JSONCodec, default_codec
+from .entity import Entity
+from .language import Language
+from .lexeme import Lexeme
+from .throttle import AdaptiveThrottle, retry_after
+from .version import user_agent
+from .wikidatasession import WikidataSession
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore[assignment]
+
+
+class AsyncWikidataSession:
+    """Asyncio counterpart of WikidataSession, requires aiohttp.
+
+    All requests share one connection pool and at most `concurrency` of them
+    are in flight at the same time. Within that the number of concurrent
+    requests adapts to the replication lag, see AdaptiveThrottle. A request
+    that is refused because of lag or overload more than max_retries times
+    raises an exception. Use it as an async context manager, which logs in (if
+    credentials are given) and closes the connections at the end::
+
+        async with AsyncWikidataSession(username, password) as repo:
+            lexemes = await repo.get_lexemes(["L2", "L3"])
+
+    The Lexemes returned are regular Lexeme objects, however their methods
+    that send requests can't be used – use the coroutines of this session
+    instead.
+    """
+
+    URL: str = "https://www.wikidata.org/w/api.php"
+    assertUser: Optional[str] = None
+    maxlag: int = 5
+    # Number of times a request is repeated because of maxlag or overload,
+    # before giving up
+    max_retries: int = 10
+    # Maximal number of ids the API accepts in one wbgetentities request
+    max_ids: int = 50
+
+    def __init__(
+        self,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        token: Optional[str] = None,
+        user_agent: str = user_agent,
+        concurrency: int = 10,
+        pool_size: int = 100,
+        throttle: Optional[AdaptiveThrottle] = None,
+        codec: Optional[JSONCodec] = None,
+    ):
+        """
+        Create an asynchronous wikidata session. The login happens when
+        entering the context manager or by awaiting login().
+
+        :param concurrency: Maximal number of requests in flight, the throttle
+                            starts at this limit and lowers it on lag
+        :param pool_size: Maximal number of open connections
+        :param throttle: Limit of concurrent requests, can be shared with
+                         other sessions
+        :param codec: Encoder and decoder of JSON, by default the fastest
+                      one available, see default_codec()
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncWikidataSession requires aiohttp to be installed")
+        self.username = username
+        self.password = password
+        self.headers = {"User-Agent": user_agent}
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.throttle = throttle or AdaptiveThrottle(
+            initial=concurrency, maximum=concurrency
+        )
+        self.codec = codec or default_codec()
+        self.S: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        if token is not None:
+            self.CSRF_TOKEN = token
+        # After login enable 'assertUser'-feature of the Mediawiki-API to
+        # make sure to never edit accidentally as IP
+        if username is not None:
+            # truncate bot name if a "bot password" is used
+            self.assertUser = username.split("@")[0]
+
+    async def __aenter__(self) -> "AsyncWikidataSession":
+        if self.username is not None and self.password is not None:
+            try:
+                await self.login()
+            except BaseException:
+                await self.close()
+                raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self) -> "aiohttp.ClientSession":
+        # The client session has to be created inside the running event loop
+        if self.S is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.S = aiohttp.ClientSession(headers=self.headers, connector=connector)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self.S
+
+    async def close(self):
+        """Close all connections of the session"""
+        if self.S is not None:
+            await self.S.close()
+            self.S = None
+
+    async def login(self):
+        # Since logins don't put load on the servers
+        # we set maxlag higher for these requests.
+        self.maxlag = 30
+        try:
+            PARAMS_1 = {
+                "action": "query",
+                "meta": "tokens",
+                "type": "login",
+                "format": "json",
+            }
+            DATA = await self.get(PARAMS_1)
+            LOGIN_TOKEN = DATA["query"]["tokens"]["logintoken"]
+
+            PARAMS_2 = {
+                "action": "login",
+                "lgname": self.username,
+                "lgpassword": self.password,
+                "format": "json",
+                "lgtoken": LOGIN_TOKEN,
+            }
+            DATA = await self.post(PARAMS_2)
+            if DATA.get("login", []).get("result") != "Success":
+                raise PermissionError("Login failed", DATA["login"]["reason"])
+            logging.info("Log in succeeded")
+
+            PARAMS_3 = {"action": "query", "meta": "tokens", "format": "json"}
+            DATA = await self.get(PARAMS_3)
+            self.CSRF_TOKEN = DATA["query"]["tokens"]["csrftoken"]
+            logging.info("Got CSRF token: %s", self.CSRF_TOKEN)
+        finally:
+            self.maxlag = 5
+
+    async def post(self, data: Dict[str, str]) -> Any:
+        """Send data to wikidata by POST request. The CSRF token is automatically
+        filled in if __AUTO__ is given instead.
+
+        :param data: Parameters to send via POST
+        :type  data: Dict[str, str])
+        :returns: Answer form the server as Objekt
+        :rtype: Any
+
+        """
+        if data.get("token") == "__AUTO__":
+            data["token"] = self.CSRF_TOKEN
+        if "assertuser" not in data and self.assertUser is not None:
+            data["assertuser"] = self.assertUser
+        data["maxlag"] = str(self.maxlag)
+        session = self._session()
+        semaphore = self._semaphore
+        assert semaphore is not None
+        for retries in count():
+            async with semaphore:
+                await self.throttle.acquire_async()
+                try:
+                    async with session.post(self.URL, data=data) as R:
+                        body = await R.read()
+                        status = R.status
+                        headers = R.headers
+                finally:
+                    self.throttle.release()
+            if status in (429, 503):
+                self._back_off(status, headers, retries)
+                continue
+            if status != 200:
+                raise Exception(
+                    "POST was unsuccessfull ({}): {}".format(status, body.decode())
+                )
+            DATA = self.codec.loads(body)
+            if "error" in DATA:
+                if DATA["error"]["code"] == "maxlag":
+                    self._back_off(status, headers, retries)
+                    continue
+                else:
+                    raise PermissionError("API returned error: " + str(DATA["error"]))
+            break
+        self.throttle.success()
+        logging.debug("Post request succeed")
+        return DATA
+
+    def _back_off(self, status: int, headers, retries: int):
+        # All requests of the session wait, the pause is awaited when
+        # acquiring the throttle
+        if retries >= self.max_retries:
+            raise Exception(
+                "Request failed after {} retries, the servers are overloaded "
+                "({})".format(retries, status)
+            )
+        sleepfor = retry_after(headers)
+        logging.info("Maxlag hit, waiting for %.1f seconds", sleepfor)
+        self.throttle.backoff(sleepfor)
+
+    async def get(self, data: Dict[str, str]) -> Any:
+        """Send a GET request to wikidata
+
+        :param data: Parameters to send via GET
+        :type  data: Dict[str, str]
+        :returns: Answer form the server as Objekt
+        :rtype: Any
+
+        """
+        session = self._session()
+        semaphore = self._semaphore
+        assert semaphore is not None
+        for retries in count():
+            async with semaphore:
+                await self.throttle.acquire_async()
+                try:
+                    async with session.get(self.URL, params=data) as R:
+                        body = await R.read()
+                        status = R.status
+                        headers = R.headers
+                finally:
+                    self.throttle.release()
+            if status in (429, 503):
+                self._back_off(status, headers, retries)
+                continue
+            DATA = self.codec.loads(body)
+            if status != 200 or "error" in DATA:
+                # We do not set maxlag for GET requests – so this error can only
+                # occur if the users sets maxlag in the request data object
+                if DATA.get("error", {}).get("code") == "maxlag":
+                    self._back_off(status, headers, retries)
+                    continue
+                else:
+                    raise Exception(
+                        "GET was unsuccessfull ({}): {}".format(status, body.decode())
+                    )
+            break
+        self.throttle.success()
+        logging.debug("Get request succeed")
+        return DATA
+
+    async def get_entities(
+        self, ids: Iterable[str], props: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Fetch the data of many entities, see WikidataSession.get_entities().
+        The requests for the chunks of ids are sent concurrently.
+
+        :param ids: Entity identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :param props: Only request these parts of the entities
+        :type  props: Optional[List[str]]
+        :rtype: Dict[str, Any]
+        """
+        ids = list(dict.fromkeys(ids))
+        requests = []
+        for i in range(0, len(ids), self.max_ids):
+            PARAMS = {
+                "action": "wbgetentities",
+                "format": "json",
+                "ids": "|".join(ids[i : i + self.max_ids]),
+            }
+            if props is not None:
+                PARAMS["props"] = "|".join(props)
+            requests.append(self.get(PARAMS))
+        entities: Dict[str, Any] = {}
+        for DATA in await asyncio.gather(*requests):
+            for entity_id, entity in DATA["entities"].items():
+                # Redirected entities are returned under their target id
+                redirect = entity.get("redirects")
+                if redirect is not None:
+                    entities[redirect["from"]] = entity
+                else:
+                    entities[entity_id] = entity
+        for entity_id in ids:
+            entities.setdefault(entity_id, {"id": entity_id, "missing": ""})
+        return entities
+
+    async def get_lexeme(self, id_lex: str) -> Lexeme:
+        """Load a lexeme.
+
+        :param id_lex: Lexeme identifier (example: "L2")
+        :type  id_lex: str
+        :rtype: Lexeme
+        """
+        entity = (await self.get_entities([id_lex]))[id_lex]
+        if "missing" in entity:
+            raise KeyError("Lexeme {} does not exist".format(id_lex))
+        return self._lexeme(entity)
+
+    async def get_lexemes(self, ids: Iterable[str]) -> List[Optional[Lexeme]]:
+        """Load many lexemes, see Lexeme.get_many().
+
+        :param ids: Lexeme identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :returns: The Lexemes in the order of the given ids, None for lexemes
+                  that don't exist
+        :rtype: List[Optional[Lexeme]]
+        """
+        ids = list(ids)
+        entities = await self.get_entities(ids)
+        lexemes: List[Optional[Lexeme]] = []
+        for id_lex in ids:
+            entity = entities[id_lex]
+            if "missing" in entity:
+                logging.warning("Lexeme %s does not exist", id_lex)
+                lexemes.append(None)
+            else:
+                lexemes.append(self._lexeme(entity))
+        return lexemes
+
+    def _lexeme(self, entity: Dict[str, Any]) -> Lexeme:
+        # The lexemes keep this session, but don't send requests through it,
+        # see the class docstring
+        return Lexeme.from_dict(cast(WikidataSession, self), entity)
+
+    async def search_lexeme_ids(
+        self, lemma: str, lang: Language, catLex: str
+    ) -> List[str]:
+        """Search for the ids of lexemes, see LexData.search_lexeme_ids().
+
+        :param lemma: the lemma of the lexeme
+        :type  lemma: str
+        :param lang: language of the lexeme
+        :type  lang: Language
+        :param catLex: lexical Category of the lexeme
+        :type  catLex: str
+        :rtype: List[str]
+        """
+        from . import _matches, _search_candidates, _search_params
+
+        DATA = await self.get(_search_params(lemma, lang))
+        if "error" in DATA:
+            raise Exception(DATA["error"])
+        candidates = _search_candidates(DATA, lemma, lang)
+        if not candidates:
+            return []
+        entities = await self.get_entities(candidates, props=["info"])
+        return [
+            idLex for idLex in candidates if _matches(entities[idLex], lang, catLex)
+        ]
+
+    async def search_lexemes(
+        self, lemma: str, lang: Language, catLex: str
+    ) -> List[Lexeme]:
+        """Search for lexemes, see LexData.search_lexemes().
+
+        :param lemma: the lemma of the lexeme
+        :type  lemma: str
+        :param lang: language of the lexeme
+        :type  lang: Language
+        :param catLex: lexical Category of the lexeme
+        :type  catLex: str
+        :rtype: List[Lexeme]
+        """
+        ids = await self.search_lexeme_ids(lemma, lang, catLex)
+        lexemes = await self.get_lexemes(ids)
+        return [lexeme for lexeme in lexemes if lexeme is not None]
+
+    async def add_claims(
+        self, entity: Entity, claims: Union[List[Claim], Dict[str, List[str]]]
+    ):
+        """Add claims to an entity, see Entity.add_claims().
+
+        :param entity: The Lexeme, Form or Sense
+        :param claims: The claims to be added to the entity
+        """
+        if not claims:
+            return
+        DATA = await self.post(entity._claims_params(claims))
+        entity._add_claims(DATA)
+
+    async def create_form(
+        self,
+        lexeme: Lexeme,
+        form: str,
+        infos_gram: List[str],
+        language: Optional[Language] = None,
+        claims: Optional[List[Claim]] = None,
+    ) -> str:
+        """Create a form for the lexeme, see Lexeme.create_form().
+
+        :param lexeme: The lexeme to add the form to
+        :type  lexeme: Lexeme
+        :returns: The id of the form
+        :rtype: str
+        """
+        DATA = await self.post(lexeme._form_params(form, infos_gram, language))
+        added_form = lexeme._add_form(DATA)
+        if claims:
+            await self.add_claims(added_form, claims)
+        return added_form.id
+
+    async def create_sense(
+        self,
+        lexeme: Lexeme,
+        glosses: Dict[str, str],
+        claims: Optional[List[Claim]] = None,
+    ) -> str:
+        """Create a sense for the lexeme, see Lexeme.create_sense().
+
+        :param lexeme: The lexeme to add the sense to
+        :type  lexeme: Lexeme
+        :returns: The id of the sense
+        :rtype: str
+        """
+        DATA = await self.post(lexeme._sense_params(glosses))
+        added_sense = lexeme._add_sense(DATA)
+        if claims:
+            await self.add_claims(added_sense, claims)
+        return added_sense.id
@@ -0,0 +1,329 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .codec import codec
+
+# Only the data of whole entities is cached, since only they have a revision
+_cachable_id = re.compile(r"^[LPQ][1-9][0-9]*$")
+
+
+def entity_title(entity_id: str) -> str:
+    """
+    Title of the wiki page of an entity (example: "L2" -> "Lexeme:L2")
+
+    :rtype: str
+    """
+    if entity_id.startswith("L"):
+        return "Lexeme:" + entity_id
+    if entity_id.startswith("P"):
+        return "Property:" + entity_id
+    return entity_id
+
+
+class DiskCache:
+    """Persistent cache of entity data stored in a SQLite database.
+
+    The entities are stored together with their revision id, so that a
+    WikidataSession using the cache can check with a cheap request whether
+    they are still up to date. If the cache grows beyond its limits, the least
+    recently used entities are evicted.
+
+    Usage::
+
+        repo = WikidataSession(cache=DiskCache("lexemes.sqlite"))
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        :param path: File name of the database
+        :param max_entries: Maximal number of entities to keep
+        :param max_bytes: Maximal size of the stored JSON data of all entities
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                "id TEXT PRIMARY KEY, lastrevid INTEGER, data TEXT, accessed REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS entities_accessed ON entities (accessed)"
+            )
+
+    @staticmethod
+    def cachable(entity_id: str) -> bool:
+        """
+        Whether the data of an entity can be stored in the cache
+
+        :rtype: bool
+        """
+        return _cachable_id.match(entity_id) is not None
+
+    def revisions(self, ids: Iterable[str]) -> Dict[str, int]:
+        """
+        The revision ids of the cached versions of the given entities
+
+        :param ids: Entity identifiers
+        :returns: Revision ids by entity id, for all cached entities
+        :rtype: Dict[str, int]
+        """
+        revisions: Dict[str, int] = {}
+        with self.lock:
+            for chunk in _chunks(list(ids)):
+                cursor = self.db.execute(
+                    "SELECT id, lastrevid FROM entities WHERE id IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                )
+                revisions.update(cursor.fetchall())
+        return revisions
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get the cached data of the given entities. Marks them as used.
+
+        :param ids: Entity identifiers
+        :returns: Entity data by id, for all cached entities
+        :rtype: Dict[str, Any]
+        """
+        entities: Dict[str, Any] = {}
+        with self.lock, self.db:
+            for chunk in _chunks(list(ids)):
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self.db.execute(
+                    "SELECT id, data FROM entities WHERE id IN ({})".format(
+                        placeholders
+                    ),
+                    chunk,
+                )
+                entities.update((i, codec.loads(data)) for i, data in cursor)
+                self.db.execute(
+                    "UPDATE entities SET accessed = ? WHERE id IN ({})".format(
+                        placeholders
+                    ),
+                    (time.time(), *chunk),
+                )
+        return entities
+
+    def put_many(self, entities: Dict[str, Any]):
+        """
+        Store the data of entities in the cache
+
+        :param entities: Entity data by id, each including its lastrevid
+        """
+        now = time.time()
+        rows = [
+            (entity_id, entity["lastrevid"], codec.dumps(entity), now)
+            for entity_id, entity in entities.items()
+            if self.cachable(entity_id) and "lastrevid" in entity
+        ]
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict()
+
+    def remove(self, ids: Iterable[str]):
+        """
+        Remove entities from the cache
+
+        :param ids: Entity identifiers
+        """
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM entities WHERE id = ?", [(i,) for i in ids]
+            )
+
+    def clear(self):
+        """Remove all entities from the cache"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entities")
+
+    def _evict(self):
+        # Drop the least recently used entities until the limits are met
+        if self.max_entries is not None:
+            self.db.execute(
+                "DELETE FROM entities WHERE id IN (SELECT id FROM entities "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            size = 0
+            cursor = self.db.execute(
+                "SELECT id, length(data) FROM entities ORDER BY accessed DESC"
+            )
+            evict = []
+            for entity_id, length in cursor:
+                size += length
+                if size > self.max_bytes:
+                    evict.append((entity_id,))
+            self.db.executemany("DELETE FROM entities WHERE id = ?", evict)
+
+    def record(self, hits: int, misses: int):
+        """
+        Count cache hits and misses
+
+        :param hits: Number of entities served from the cache
+        :param misses: Number of entities not cached or outdated
+        """
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of cache hits, misses and cached entities
+
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            (entries,) = self.db.execute("SELECT count(*) FROM entities").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def __len__(self) -> int:
+        return self.stats["entries"]
+
+
+class MemoryCache:
+    """In-process cache of entity data with least recently used eviction.
+
+    Entries expire after ttl seconds, since other users might edit the
+    entities. Edits done by the WikidataSession using the cache remove the
+    edited entity from the cache. The data is stored serialized, so every
+    lookup returns an independent copy.
+
+    Usage::
+
+        repo = WikidataSession(memory_cache=MemoryCache(max_entries=1000, ttl=60))
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        """
+        :param max_entries: Maximal number of entities to keep
+        :param max_bytes: Maximal size of the serialized data of all entities
+        :param ttl: Seconds after which an entry is considered outdated
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.lock = threading.Lock()
+        # entity id -> (time of expiry, serialized data)
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get copies of the cached data of the given entities and count hits
+        and misses.
+
+        :param ids: Entity identifiers
+        :returns: Entity data by id, for all cached and not expired entities
+        :rtype: Dict[str, Any]
+        """
+        entities = {}
+        now = time.monotonic()
+        misses = 0
+        with self.lock:
+            for entity_id in ids:
+                entry = self.entries.get(entity_id)
+                if entry is None:
+                    misses += 1
+                elif entry[0] < now:
+                    misses += 1
+                    self._remove(entity_id)
+                else:
+                    self.entries.move_to_end(entity_id)
+                    entities[entity_id] = entry[1]
+            self.hits += len(entities)
+            self.misses += misses
+        return {i: codec.loads(data) for i, data in entities.items()}
+
+    def put_many(self, entities: Dict[str, Any]):
+        """
+        Store the data of entities in the cache
+
+        :param entities: Entity data by id
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        serialized = [
+            (i, codec.dumps(e)) for i, e in entities.items() if "missing" not in e
+        ]
+        with self.lock:
+            for entity_id, data in serialized:
+                self._remove(entity_id)
+                self.entries[entity_id] = (expires, data)
+                self.size += len(data)
+            # Drop the least recently used entities until the limits are met
+            while self.entries and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries)
+                or (self.max_bytes is not None and self.size > self.max_bytes)
+            ):
+                self._remove(next(iter(self.entries)))
+
+    def remove(self, ids: Iterable[str]):
+        """
+        Remove entities from the cache
+
+        :param ids: Entity identifiers
+        """
+        with self.lock:
+            for entity_id in ids:
+                self._remove(entity_id)
+
+    def _remove(self, entity_id: str):
+        entry = self.entries.pop(entity_id, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        """Remove all entities from the cache"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of cache hits, misses, cached entities and their size
+
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.size,
+            }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _chunks(ids: List[str], size: int = 500) -> Iterable[List[str]]:
+    # SQLite limits the number of variables in a statement
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
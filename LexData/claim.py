@@ -1,6 +1,7 @@
 from typing import Any, Dict, Optional, Tuple, Union
 
 from .utils import build_snak
+from .wikidatasession import WikidataSession
 
 
 class Claim(dict):
@@ -13,6 +14,8 @@ class Claim(dict):
       have not yet been uploaded to Wikidata. These are called 'Detached Claims',
       since they don't belong to any entity.  They don't have an id nor an hash.
       They can be added to an entity by the function Entity.add_claims().
+      The datatype of the property is looked up with the session repo if it
+      is not known yet, see utils.get_property_types() to prefetch them.
 
     Currently modifications on both types of claims can't be uploaded, except
     by use of the low level API call Lexeme.update_from_json().
@@ -26,12 +29,13 @@ class Claim(dict):
         claim: Optional[Dict[str, Any]] = None,
         property_id: Optional[str] = None,
         value: Optional[Any] = None,
+        repo: Optional[WikidataSession] = None,
     ):
         super().__init__()
         if isinstance(claim, dict) and not property_id and not value:
             self.update(claim)
         elif claim is None and property_id and value:
-            self["mainsnak"] = build_snak(property_id, value)
+            self["mainsnak"] = build_snak(property_id, value, repo)
             self["rank"] = "normal"
         else:
             raise TypeError(
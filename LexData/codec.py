@@ -0,0 +1,69 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+
+class JSONCodec:
+    """Encoder and decoder of JSON using the standard library.
+
+    A session uses its codec for all answers of the API and the JSON data it
+    sends. See default_codec() for the fastest available one.
+    """
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> str:
+        """
+        Serialize an object to JSON
+
+        :rtype: str
+        """
+        return json.dumps(obj)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        """
+        Deserialize JSON, given as text or UTF-8 encoded bytes
+
+        :rtype: Any
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """Encoder and decoder of JSON using orjson, which is several times faster
+    than the standard library. Requires orjson to be installed."""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires orjson to be installed")
+
+    def dumps(self, obj: Any) -> str:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # For example integers larger than 64 bit
+            return json.dumps(obj)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+def default_codec() -> JSONCodec:
+    """
+    The fastest available codec: orjson if installed, else the standard library
+
+    :rtype: JSONCodec
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    return JSONCodec()
+
+
+# Used where no session is at hand, like the caches and dump readers
+codec = default_codec()
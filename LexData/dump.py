@@ -0,0 +1,312 @@
+"""
+Read the lexemes of a Wikidata JSON dump without a session, for example
+https://dumps.wikimedia.org/wikidatawiki/entities/latest-lexemes.json.gz
+
+The dump is streamed line by line – one entity per line – so the memory
+usage doesn't depend on its size. Alternatively a decompressed dump can be
+used as backend of a session with random access to the lexemes.
+"""
+import bz2
+import gzip
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .codec import codec
+from .form import Form
+from .language import Language
+from .lexeme import Lexeme
+from .sense import Sense
+from .wikidatasession import WikidataSession
+
+_language_re = re.compile(rb'"language":\s*"(Q[0-9]+)"')
+_category_re = re.compile(rb'"lexicalCategory":\s*"(Q[0-9]+)"')
+# The id of the lexeme comes before the ids of its forms and senses
+_id_re = re.compile(rb'"id":\s*"L([0-9]+)"')
+# Index entries: numeric id, offset and length of the lexeme in the dump
+_index_record = struct.Struct("<IQI")
+
+
+def _entity_line(line: bytes) -> Optional[bytes]:
+    # Strip the syntax of the surrounding JSON array
+    line = line.strip()
+    if line.endswith(b","):
+        line = line[:-1]
+    if not line or line in (b"[", b"]"):
+        return None
+    return line
+
+
+class DumpReader:
+    """Stream the lexemes of a JSON dump.
+
+    Usage::
+
+        reader = DumpReader("latest-lexemes.json.gz", languages=[lang_nb])
+        for lexeme in reader:
+            print(lexeme.lemma)
+
+    Lexemes can be filtered by their language and lexical category. This
+    filtering happens on the raw lines, so non-matching lexemes are not
+    decoded at all. The Lexemes, Forms and Senses are not bound to a session,
+    so their methods sending requests can't be used.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        languages: Optional[Iterable[Union[Language, str]]] = None,
+        categories: Optional[Iterable[str]] = None,
+        progress: Optional[Callable[[Dict[str, float]], Any]] = None,
+        progress_interval: int = 100000,
+    ):
+        """
+        :param path: File name of the dump (.json, .json.gz or .json.bz2)
+        :param languages: Only read lexemes of these languages (Language
+                          objects or QIDs)
+        :param categories: Only read lexemes of these lexical categories (QIDs)
+        :param progress: Called with the current stats every
+                         progress_interval lexemes, by default they are logged
+        :param progress_interval: Number of lexemes between progress reports
+        """
+        self.path = path
+        self.languages = None
+        if languages is not None:
+            self.languages = {
+                lang.qid if isinstance(lang, Language) else lang for lang in languages
+            }
+        self.categories = set(categories) if categories is not None else None
+        self.progress = progress or self._log_progress
+        self.progress_interval = progress_interval
+        self.stats: Dict[str, float] = {}
+
+    def _matches(self, line: bytes) -> bool:
+        if self.languages is not None:
+            match = _language_re.search(line)
+            if match is None or match.group(1).decode() not in self.languages:
+                return False
+        if self.categories is not None:
+            match = _category_re.search(line)
+            if match is None or match.group(1).decode() not in self.categories:
+                return False
+        return True
+
+    def entities(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the raw data of the matching lexemes
+
+        :rtype: Iterator[Dict[str, Any]]
+        """
+        size = os.path.getsize(self.path)
+        start = time.monotonic()
+        read = matched = 0
+        with open(self.path, "rb") as raw:
+            stream: Iterable[bytes] = raw
+            if self.path.endswith(".gz"):
+                stream = gzip.GzipFile(fileobj=raw)
+            elif self.path.endswith(".bz2"):
+                stream = bz2.BZ2File(raw)
+            for line in stream:
+                entity_line = _entity_line(line)
+                if entity_line is None:
+                    continue
+                read += 1
+                if self._matches(entity_line):
+                    entity = codec.loads(entity_line)
+                    if (
+                        self.languages is None
+                        or entity.get("language") in self.languages
+                    ) and (
+                        self.categories is None
+                        or entity.get("lexicalCategory") in self.categories
+                    ):
+                        matched += 1
+                        yield entity
+                if read % self.progress_interval == 0:
+                    self._update_stats(read, matched, raw.tell(), size, start)
+                    self.progress(self.stats)
+            self._update_stats(read, matched, raw.tell(), size, start)
+
+    def _update_stats(
+        self, read: int, matched: int, position: int, size: int, start: float
+    ):
+        elapsed = time.monotonic() - start
+        self.stats = {
+            "read": read,
+            "matched": matched,
+            "bytes": position,
+            "progress": position / size if size else 1.0,
+            "elapsed": elapsed,
+            "lexemes_per_second": read / elapsed if elapsed else 0.0,
+            "bytes_per_second": position / elapsed if elapsed else 0.0,
+        }
+
+    @staticmethod
+    def _log_progress(stats: Dict[str, float]):
+        logging.info(
+            "Read %d lexemes (%.1f%%), %d matching, %.0f lexemes/s",
+            stats["read"],
+            stats["progress"] * 100,
+            stats["matched"],
+            stats["lexemes_per_second"],
+        )
+
+    def __iter__(self) -> Iterator[Lexeme]:
+        for entity in self.entities():
+            yield Lexeme.from_dict(None, entity)
+
+    def forms(self) -> Iterator[Form]:
+        """
+        Iterate over the forms of the matching lexemes
+
+        :rtype: Iterator[Form]
+        """
+        for lexeme in self:
+            yield from lexeme.forms
+
+    def senses(self) -> Iterator[Sense]:
+        """
+        Iterate over the senses of the matching lexemes
+
+        :rtype: Iterator[Sense]
+        """
+        for lexeme in self:
+            yield from lexeme.senses
+
+
+def build_index(path: str, index_path: Optional[str] = None) -> str:
+    """
+    Build the index of the byte offsets of the lexemes in a decompressed dump,
+    as needed by DumpSession.
+
+    :param path: File name of the decompressed dump
+    :param index_path: File name of the index, by default path + ".idx"
+    :returns: The file name of the index
+    :rtype: str
+    """
+    index_path = index_path or path + ".idx"
+    records = []
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            entity_line = _entity_line(line)
+            if entity_line is not None:
+                match = _id_re.search(entity_line)
+                if match is not None:
+                    start = offset + line.index(entity_line[:1])
+                    records.append((int(match.group(1)), start, len(entity_line)))
+            offset += len(line)
+    records.sort()
+    with open(index_path, "wb") as f:
+        for record in records:
+            f.write(_index_record.pack(*record))
+    logging.info("Indexed %d lexemes of %s", len(records), path)
+    return index_path
+
+
+class DumpSession(WikidataSession):
+    """Read-only session serving the lexemes of a local, decompressed dump.
+
+    It answers wbgetentities requests like the API, so the rest of LexData
+    can be used unchanged::
+
+        repo = DumpSession("latest-lexemes.json")
+        L2 = Lexeme(repo, "L2")
+
+    On first use an index of the byte offsets of all lexemes is built and
+    stored next to the dump. Dump and index are memory-mapped, a lookup only
+    decodes the requested lexeme.
+    """
+
+    def __init__(self, path: str, index_path: Optional[str] = None):
+        """
+        :param path: File name of the decompressed dump
+        :param index_path: File name of the index, by default path + ".idx"
+        """
+        super().__init__()
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        if not os.path.exists(self.index_path) or os.path.getmtime(
+            self.index_path
+        ) < os.path.getmtime(path):
+            build_index(path, self.index_path)
+        with open(path, "rb") as f:
+            self.dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index: Union[mmap.mmap, bytes]
+        with open(self.index_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.index = b""
+        self.size = len(self.index) // _index_record.size
+
+    def _lookup(self, numeric_id: int) -> Optional[Tuple[int, int]]:
+        # Binary search in the sorted index
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            record_id, offset, length = _index_record.unpack_from(
+                self.index, middle * _index_record.size
+            )
+            if record_id == numeric_id:
+                return offset, length
+            if record_id < numeric_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_entity(self, entity_id: str) -> Dict[str, Any]:
+        """
+        Get the data of a lexeme, form or sense from the dump
+
+        :param entity_id: Entity identifier (example: "L2" or "L2-F1")
+        :returns: The entity data, ``{"id": …, "missing": ""}`` if it isn't
+                  in the dump
+        :rtype: Dict[str, Any]
+        """
+        missing = {"id": entity_id, "missing": ""}
+        lexeme_id = entity_id.split("-")[0]
+        if not re.match(r"^L[0-9]+$", lexeme_id):
+            return missing
+        position = self._lookup(int(lexeme_id[1:]))
+        if position is None:
+            return missing
+        offset, length = position
+        lexeme = codec.loads(self.dump[offset : offset + length])
+        if lexeme_id == entity_id:
+            return lexeme
+        for part in lexeme.get("forms", []) + lexeme.get("senses", []):
+            if part["id"] == entity_id:
+                return part
+        return missing
+
+    def get(self, data: Dict[str, str]) -> Any:
+        """Answer a wbgetentities request from the dump. Other requests are
+        not supported.
+
+        :param data: Parameters of the request
+        :type  data: Dict[str, str]
+        :returns: Answer in the format of the API
+        :rtype: Any
+
+        """
+        if data.get("action") != "wbgetentities":
+            raise NotImplementedError(
+                "DumpSession doesn't support the action {}".format(data.get("action"))
+            )
+        entities = {i: self.get_entity(i) for i in data["ids"].split("|")}
+        return {"entities": entities, "success": 1}
+
+    def post(self, data: Dict[str, str]) -> Any:
+        raise PermissionError("DumpSession is read-only")
+
+    def close(self):
+        """Close the memory-mapped files"""
+        self.dump.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Set, Union
+
+from .claim import Claim
+from .entity import Entity, _entity_type, build_claims
+from .form import build_form
+from .language import Language
+from .lexeme import Lexeme
+from .sense import build_sense
+from .wikidatasession import WikidataSession
+
+
+class EditError(Exception):
+    """An edit queued in an EditQueue failed.
+
+    The exception raised by the API is available as __cause__.
+    """
+
+    def __init__(self, operation: str, entity_id: str, cause: BaseException):
+        super().__init__("{} on {} failed: {}".format(operation, entity_id, cause))
+        self.operation = operation
+        self.entity_id = entity_id
+        self.__cause__ = cause
+
+
+class _Operation:
+    __slots__ = ("name", "entity", "data", "future")
+
+    def __init__(self, name: str, entity: Entity, data: Any):
+        self.name = name
+        self.entity = entity
+        self.data = data
+        self.future: Future = Future()
+
+
+class EditQueue:
+    """Write-behind queue of edits, that returns futures instead of waiting
+    for the answers of the API.
+
+    Edits of the same lexeme (including its forms and senses) are sent in
+    the order they were queued, edits of different lexemes are sent in
+    parallel by a pool of threads. Edits of a lexeme that are queued while
+    another one is sent are merged into one wbeditentity::
+
+        with repo.edit_queue(workers=4) as edits:
+            futures = [edits.create_form(lexeme, form, ["Q110786"]) for …]
+            edits.add_claims(lexeme, {"P5137": ["Q1"]})
+        form_ids = [future.result() for future in futures]
+
+    Failed edits are reported by their futures with an EditError. The local
+    Lexeme, Form and Sense objects are updated from the answers of the API,
+    but only after the edits are done – use flush() to wait for that.
+    """
+
+    def __init__(
+        self,
+        repo: WikidataSession,
+        workers: int = 4,
+        max_rate: Optional[float] = None,
+        max_merge: int = 50,
+    ):
+        """
+        :param repo: Wikidata Session to send the edits with
+        :param workers: Number of edits sent in parallel
+        :param max_rate: Maximal number of edits per second, None for no limit
+                         besides the throttle of the session
+        :param max_merge: Maximal number of queued operations merged into one
+                          edit
+        """
+        self.repo = repo
+        self.max_rate = max_rate
+        self.max_merge = max_merge
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Queued operations by lexeme id, and the lexemes being sent
+        self._pending: Dict[str, Deque[_Operation]] = {}
+        self._active: Set[str] = set()
+        self._outstanding = 0
+        self._condition = threading.Condition()
+        self._rate_lock = threading.Lock()
+        self._next_edit = 0.0
+
+    def __enter__(self) -> "EditQueue":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.join()
+
+    def create_form(
+        self,
+        lexeme: Lexeme,
+        form: str,
+        infos_gram: List[str],
+        language: Optional[Language] = None,
+        claims: Optional[Union[List[Claim], Dict[str, List[str]]]] = None,
+    ) -> "Future[str]":
+        """Queue the creation of a form, see Lexeme.create_form().
+
+        :returns: Future of the id of the form
+        :rtype: Future[str]
+        """
+        languagename = language.short if language is not None else lexeme.language
+        data = build_form(form, infos_gram, languagename, claims)
+        return self._submit(_Operation("create_form", lexeme, data))
+
+    def create_sense(
+        self,
+        lexeme: Lexeme,
+        glosses: Dict[str, str],
+        claims: Optional[Union[List[Claim], Dict[str, List[str]]]] = None,
+    ) -> "Future[str]":
+        """Queue the creation of a sense, see Lexeme.create_sense().
+
+        :returns: Future of the id of the sense
+        :rtype: Future[str]
+        """
+        data = build_sense(glosses, claims)
+        return self._submit(_Operation("create_sense", lexeme, data))
+
+    def add_claims(
+        self, entity: Entity, claims: Union[List[Claim], Dict[str, List[str]]]
+    ) -> "Future[None]":
+        """Queue adding claims to a Lexeme, Form or Sense, see
+        Entity.add_claims().
+
+        :rtype: Future[None]
+        """
+        return self._submit(_Operation("add_claims", entity, build_claims(claims)))
+
+    def _submit(self, operation: _Operation) -> Future:
+        lexeme_id = operation.entity.id.split("-")[0]
+        with self._condition:
+            self._outstanding += 1
+            self._pending.setdefault(lexeme_id, deque()).append(operation)
+            if lexeme_id not in self._active:
+                self._active.add(lexeme_id)
+                self.executor.submit(self._run, lexeme_id)
+        return operation.future
+
+    def _run(self, lexeme_id: str):
+        # Send the queued edits of a lexeme until there are no more
+        while True:
+            with self._condition:
+                pending = self._pending.get(lexeme_id)
+                if not pending:
+                    self._pending.pop(lexeme_id, None)
+                    self._active.discard(lexeme_id)
+                    return
+                batch: List[_Operation] = []
+                while pending and len(batch) < self.max_merge:
+                    batch.append(pending.popleft())
+            taken = len(batch)
+            # Cancelled operations are skipped, but count as done
+            batch = [op for op in batch if op.future.set_running_or_notify_cancel()]
+            try:
+                if batch:
+                    self._send(lexeme_id, batch)
+            finally:
+                with self._condition:
+                    self._outstanding -= taken
+                    self._condition.notify_all()
+
+    def _wait_for_rate(self):
+        if self.max_rate is None:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_edit - now
+            self._next_edit = max(now, self._next_edit) + 1 / self.max_rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def _send(self, lexeme_id: str, batch: List[_Operation]):
+        # Merge the operations into one edit of the lexeme
+        data: Dict[str, List[Any]] = {"claims": [], "forms": [], "senses": []}
+        parts: Dict[str, Dict[str, Any]] = {}
+        for op in batch:
+            if op.name == "create_form":
+                data["forms"].append(dict(op.data, add=""))
+            elif op.name == "create_sense":
+                data["senses"].append(dict(op.data, add=""))
+            elif isinstance(op.entity, Lexeme):
+                data["claims"].extend(op.data)
+            else:
+                part = parts.get(op.entity.id)
+                if part is None:
+                    part = parts[op.entity.id] = {"id": op.entity.id, "claims": []}
+                    data[_entity_type(op.entity.id) + "s"].append(part)
+                part["claims"].extend(op.data)
+        PARAMS = {
+            "action": "wbeditentity",
+            "format": "json",
+            "bot": "1",
+            "id": lexeme_id,
+            "token": "__AUTO__",
+            "data": self.repo.codec.dumps({k: v for k, v in data.items() if v}),
+        }
+        try:
+            self._wait_for_rate()
+            DATA = self.repo.post(PARAMS)
+            if DATA.get("success") != 1:
+                raise ValueError(DATA)
+        except Exception as e:
+            logging.error("Edit of %s failed: %s", lexeme_id, e)
+            for op in batch:
+                op.future.set_exception(EditError(op.name, op.entity.id, e))
+            return
+        try:
+            self._apply(batch, DATA["entity"])
+        except Exception:
+            # The edit is saved, only the local objects are out of date
+            logging.exception("Edit of %s saved, but not applied locally", lexeme_id)
+            for op in batch:
+                if not op.future.done():
+                    op.future.set_result(None)
+
+    def _apply(self, batch: List[_Operation], entity: Dict[str, Any]):
+        # Update the local objects and resolve the futures from the answer
+        created: Dict[str, List[str]] = {}
+        for key, op_name in (("forms", "create_form"), ("senses", "create_sense")):
+            count = sum(op.name == op_name for op in batch)
+            # The new ones got the highest ids, in the order they were added
+            ids = sorted(
+                (part["id"] for part in entity.get(key, [])),
+                key=lambda i: int(i.split("-")[1][1:]),
+            )
+            created[op_name] = ids[len(ids) - count :] if count else []
+        parts = {
+            part["id"]: part
+            for key in ("forms", "senses")
+            for part in entity.get(key, [])
+        }
+        updated: Set[int] = set()
+        for op in batch:
+            try:
+                self._update(op.entity, entity, parts, updated)
+            except Exception:
+                # The edit is saved nevertheless, see _send()
+                logging.exception(
+                    "Edit of %s saved, but not applied locally", op.entity.id
+                )
+            if op.name in created:
+                op.future.set_result(created[op.name].pop(0))
+            else:
+                op.future.set_result(None)
+        logging.info("Edited %s with %d operations", entity.get("id"), len(batch))
+
+    def _update(
+        self,
+        target: Entity,
+        entity: Dict[str, Any],
+        parts: Dict[str, Dict[str, Any]],
+        updated: Set[int],
+    ):
+        # Update one of the local objects of the batch from the answer
+        if isinstance(target, Lexeme):
+            if id(target) not in updated:
+                target._update_from_answer(entity)
+                updated.add(id(target))
+        elif target.id in parts:
+            # Forms and senses pass the new revision and their claims on
+            # to their lexeme, which takes them over by the id of the part.
+            # A copy, so that the objects don't share the claims.
+            codec = self.repo.codec
+            part = codec.loads(codec.dumps(parts[target.id]))
+            part["lastrevid"] = entity.get("lastrevid")
+            target._add_claims({"success": 1, "entity": part})
+
+    def flush(self):
+        """Wait until all queued edits are done"""
+        with self._condition:
+            while self._outstanding:
+                self._condition.wait()
+
+    def join(self):
+        """Wait until all queued edits are done and stop the threads. No
+        edits can be queued afterwards."""
+        self.flush()
+        self.executor.shutdown()
@@ -1,6 +1,5 @@
-import json
 import logging
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 from .claim import Claim
 from .wikidatasession import WikidataSession
@@ -15,18 +14,31 @@ class Entity(dict):
     def __init__(self, repo: WikidataSession):
         super().__init__()
         self.repo = repo
+        # The containers of the entity's data that already hold wrapper objects
+        self._views: Dict[str, Any] = {}
 
     @property
     def claims(self) -> Dict[str, List[Claim]]:
         """
         All the claims of the Entity
 
+        The claims are wrapped into Claim objects in place, so modifications
+        of the returned dictionary change the entity.
+
         :rtype: Dict[str, List[Claim]]
         """
-        if self.get("claims", {}):
-            return {k: [Claim(c) for c in v] for k, v in self.get("claims", {}).items()}
-        else:
-            return {}
+        claims: Any = self.get("claims")
+        if not isinstance(claims, dict):
+            # The API returns an empty list if there are no claims
+            claims = {}
+            self["claims"] = claims
+        if self._views.get("claims") is not claims:
+            for values in claims.values():
+                for i, claim in enumerate(values):
+                    if not isinstance(claim, Claim):
+                        values[i] = Claim(claim)
+            self._views["claims"] = claims
+        return claims
 
     def add_claims(self, claims: Union[List[Claim], Dict[str, List[str]]]):
         """
@@ -47,13 +59,41 @@ class Entity(dict):
 
                        The first supports all datatypes, whereas the later
                        currently only supports datatypes of kind Entity.
+
+                       All claims are added with one edit. Afterwards the
+                       claims of the entity are the ones returned by the API.
         """
-        if isinstance(claims, list):
-            self.__set_claims__(claims)
-        elif isinstance(claims, dict):
-            self.__create_claims__(claims)
-        else:
-            raise TypeError("Invalid argument type:", type(claims))
+        if not claims:
+            return
+        DATA = self.repo.post(self._claims_params(claims))
+        self._add_claims(DATA)
+
+    def _claims_params(
+        self, claims: Union[List[Claim], Dict[str, List[str]]]
+    ) -> Dict[str, str]:
+        return {
+            "action": "wbeditentity",
+            "format": "json",
+            "bot": "1",
+            "id": self.id,
+            "token": "__AUTO__",
+            "data": self.repo.codec.dumps({"claims": build_claims(claims)}),
+        }
+
+    def _add_claims(self, DATA: Dict):
+        if DATA.get("success") != 1:
+            raise ValueError(DATA)
+        entity = DATA["entity"]
+        logging.info("Claims added to %s", self.id)
+
+        # Take over the claims of the entity as they are on the server
+        self["claims"] = entity.get("claims", {})
+        self._edited(entity.get("lastrevid"))
+
+    def _edited(self, lastrevid: Optional[int]):
+        # Take over the revision created by an edit of the entity
+        if lastrevid is not None:
+            self["lastrevid"] = lastrevid
 
     def __set_claims__(self, claims: List[Claim]):
         """
@@ -61,9 +101,7 @@ class Entity(dict):
 
         :param claims: The list of claims to be added
         """
-        for claim in claims:
-            pid = claim.property
-            self.__set_claim__(str(pid), claim)
+        self.add_claims(claims)
 
     def __create_claims__(self, claims: Dict[str, List[str]]):
         """
@@ -74,47 +112,7 @@ class Entity(dict):
 
         :param claims: The set of claims to be added
         """
-        for cle, values in claims.items():
-            for value in values:
-                self.__set_entity_claim__(cle, value)
-
-    def __set_entity_claim__(self, id_prop: str, id_str: str):
-        """
-        Add a claim of an entity-type to the entity.
-
-        Supported types are Lexeme, Form, Sense, Item, Property.
-
-        :param id_prop: id of the property (example: "P31")
-        :param idItem: id of the entity (example: "Q1")
-        """
-        entity_id = int(id_str[1:])
-        claim_value = json.dumps({"entity-type": "item", "numeric-id": entity_id})
-        self.__set_claim__(id_prop, claim_value)
-
-    def __set_claim__(self, id_prop: str, claim_value):
-        PARAMS = {
-            "action": "wbcreateclaim",
-            "format": "json",
-            "entity": self.id,
-            "snaktype": "value",
-            "bot": "1",
-            "property": id_prop,
-            "value": claim_value,
-            "token": "__AUTO__",
-        }
-
-        DATA = self.repo.post(PARAMS)
-        assert "claim" in DATA
-        added_claim = DATA["claim"]
-        logging.info("Claim added")
-
-        # Add the created claim to the local entity instance
-        if not self.get("claims", []):
-            self["claims"] = {id_prop: added_claim}
-        elif id_prop in self.claims:
-            self.claims[id_prop].append(added_claim)
-        else:
-            self.claims[id_prop] = [added_claim]
+        self.add_claims(claims)
 
     @property
     def id(self) -> str:
@@ -124,3 +122,44 @@ class Entity(dict):
 
     def __str__(self) -> str:
         return super().__repr__()
+
+
+def _entity_type(id_str: str) -> str:
+    if "-F" in id_str:
+        return "form"
+    if "-S" in id_str:
+        return "sense"
+    return {"L": "lexeme", "P": "property"}.get(id_str[0], "item")
+
+
+def build_claims(
+    claims: Union[List[Claim], Dict[str, List[str]]]
+) -> List[Dict[str, Any]]:
+    """
+    Build the json of statements as expected by wbeditentity.
+
+    :param claims: The claims in one of the formats supported by
+                   Entity.add_claims()
+    :rtype: List[Dict[str, Any]]
+    """
+    if isinstance(claims, list):
+        return [dict(claim, type="statement") for claim in claims]
+    elif isinstance(claims, dict):
+        return [
+            {
+                "mainsnak": {
+                    "snaktype": "value",
+                    "property": cle,
+                    "datavalue": {
+                        "value": {"entity-type": _entity_type(value), "id": value},
+                        "type": "wikibase-entityid",
+                    },
+                },
+                "type": "statement",
+                "rank": "normal",
+            }
+            for cle, values in claims.items()
+            for value in values
+        ]
+    else:
+        raise TypeError("Invalid argument type:", type(claims))
@@ -1,15 +1,27 @@
-from typing import Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from .entity import Entity
+from .entity import Entity, build_claims
 from .wikidatasession import WikidataSession
 
+if TYPE_CHECKING:
+    from .lexeme import Lexeme
+
 
 class Form(Entity):
     """Wrapper around a dict to represent a From"""
 
-    def __init__(self, repo: WikidataSession, form: Dict):
+    def __init__(
+        self, repo: WikidataSession, form: Dict, lexeme: Optional["Lexeme"] = None
+    ):
         super().__init__(repo)
         self.update(form)
+        # The lexeme the form belongs to, updated when the form is edited
+        self.lexeme = lexeme
+
+    def _edited(self, lastrevid: Optional[int]):
+        # The revision belongs to the lexeme, not to the form
+        if self.lexeme is not None:
+            self.lexeme._part_edited(self, lastrevid)
 
     @property
     def form(self) -> str:
@@ -22,3 +34,24 @@ class Form(Entity):
 
     def __repr__(self) -> str:
         return "<Form '{}'>".format(self.form)
+
+
+def build_form(
+    form: str, infos_gram: List[str], language: str, claims: Optional[Any] = None
+) -> Dict[str, Any]:
+    """
+    Build the json of a new form as expected by the API.
+
+    :param form: the representation of the form
+    :param infos_gram: grammatical features
+    :param language: language code of the representation
+    :param claims: claims of the form, see Entity.add_claims()
+    :rtype: Dict[str, Any]
+    """
+    data_form: Dict[str, Any] = {
+        "representations": {language: {"value": form, "language": language}},
+        "grammaticalFeatures": infos_gram,
+    }
+    if claims:
+        data_form["claims"] = build_claims(claims)
+    return data_form
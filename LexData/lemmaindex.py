@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .language import Language
+
+
+class LemmaIndex:
+    """Persistent index of lexeme ids by lemma, language and lexical category,
+    stored in a SQLite database.
+
+    A WikidataSession created with lemma_index=LemmaIndex(path) answers
+    search_lexemes() and get_or_create_lexeme() from the index if it knows
+    the lemma and only falls back to the search API otherwise. Lexemes found
+    by the API or created by the session are added to the index.
+
+    The index can be built from a dump or from lexemes fetched earlier.
+    Edits done by others after that are not reflected.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: File name of the database
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS lemmas (lemma TEXT, language TEXT, "
+                "category TEXT, id TEXT, PRIMARY KEY (lemma, language, category, id))"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS lemmas_id ON lemmas (id)")
+
+    def add(self, lexemes: Iterable[Dict[str, Any]]):
+        """
+        Add lexemes to the index, replacing older entries of them
+
+        :param lexemes: Lexemes or their raw data, needs at least the id,
+                        lemmas, language and lexicalCategory
+        """
+        ids = []
+        rows = []
+        for lexeme in lexemes:
+            if "missing" in lexeme:
+                continue
+            ids.append((lexeme["id"],))
+            for lemma in lexeme["lemmas"].values():
+                rows.append(
+                    (
+                        lemma["value"],
+                        lexeme["language"],
+                        lexeme["lexicalCategory"],
+                        lexeme["id"],
+                    )
+                )
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM lemmas WHERE id = ?", ids)
+            self.db.executemany("INSERT OR IGNORE INTO lemmas VALUES (?, ?, ?, ?)", rows)
+
+    def remove(self, ids: Iterable[str]):
+        """
+        Remove lexemes from the index
+
+        :param ids: Lexeme identifiers
+        """
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM lemmas WHERE id = ?", [(i,) for i in ids]
+            )
+
+    def build_from_dump(
+        self,
+        path: str,
+        languages: Optional[Iterable[Union[Language, str]]] = None,
+        categories: Optional[Iterable[str]] = None,
+        batch_size: int = 10000,
+    ):
+        """
+        Add all lexemes of a dump to the index
+
+        :param path: File name of the dump, see LexData.dump.DumpReader
+        :param languages: Only add lexemes of these languages
+        :param categories: Only add lexemes of these lexical categories
+        :param batch_size: Number of lexemes to add per transaction
+        """
+        from .dump import DumpReader
+
+        batch = []
+        for entity in DumpReader(path, languages, categories).entities():
+            batch.append(entity)
+            if len(batch) >= batch_size:
+                self.add(batch)
+                batch = []
+        self.add(batch)
+
+    def lookup(
+        self, lemma: str, lang: Union[Language, str], catLex: str
+    ) -> List[str]:
+        """
+        Get the ids of the lexemes with the given lemma, language and lexical
+        category
+
+        :param lemma: the lemma of the lexeme
+        :type  lemma: str
+        :param lang: language of the lexeme, as Language or QID
+        :param catLex: lexical Category of the lexeme
+        :type  catLex: str
+        :rtype: List[str]
+        """
+        qid = lang.qid if isinstance(lang, Language) else lang
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT id FROM lemmas WHERE lemma = ? AND language = ? "
+                "AND category = ? ORDER BY length(id), id",
+                (lemma, qid, catLex),
+            )
+            return [i for (i,) in cursor]
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = self.db.execute(
+                "SELECT count(DISTINCT id) FROM lemmas"
+            ).fetchone()
+        return count
@@ -1,36 +1,268 @@
-import json
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, cast
 
 from .claim import Claim
-from .entity import Entity
-from .form import Form
+from .codec import codec
+from .entity import Entity, _entity_type
+from .form import Form, build_form
 from .language import Language
-from .sense import Sense
+from .sense import Sense, build_sense
 from .wikidatasession import WikidataSession
 
 
 class Lexeme(Entity):
-    """Wrapper around a dict to represent a Lexeme"""
+    """Wrapper around a dict to represent a Lexeme
+
+    Parts of a lexeme might not be loaded (for example after an edit, if the
+    answer of the API doesn't contain them, or if only some parts were
+    selected when loading it). They are loaded on the first access via
+    ``lexeme[key]`` or ``lexeme.get(key)``.
+
+    A lexeme loaded only in some languages contains only the lemmas,
+    representations and glosses in these languages, see load().
+
+    The data is remembered as loaded, so that local modifications can be
+    uploaded with save().
+    """
+
+    # Parts of a lexeme that can be selected when loading it. The API can
+    # only leave out the claims, so only a selection without "claims" reduces
+    # the transfer – the other parts are dropped after loading.
+    selectable = (
+        "lemmas",
+        "lexicalCategory",
+        "language",
+        "claims",
+        "forms",
+        "senses",
+    )
+
+    # Keys of the entity that are not loaded yet
+    _unloaded: FrozenSet[str] = frozenset()
+    # Whether this is a lazy handle, that is not loaded at all yet
+    _lazy: bool = False
+    # The languages the lexeme is restricted to, None for all languages
+    languages: Optional[FrozenSet[str]] = None
+
+    def __init__(
+        self,
+        repo: WikidataSession,
+        id_lex: str,
+        props: Optional[Iterable[str]] = None,
+        languages: Optional[Iterable[str]] = None,
+    ):
+        """
+        Load a lexeme
 
-    def __init__(self, repo: WikidataSession, id_lex: str):
+        :param repo: Wikidata Session
+        :param id_lex: Lexeme identifier (example: "L2")
+        :param props: Only load these parts of the lexeme (example:
+                      ["lemmas", "claims"]), see Lexeme.selectable. The
+                      others are loaded on their first access. Only leaving
+                      out "claims" makes the request smaller, the other parts
+                      are dropped locally.
+        :param languages: Only keep the lemmas, representations and glosses
+                          in these languages (example: ["nb", "nn"]). They
+                          are filtered locally, all languages are transferred.
+        """
         super().__init__(repo)
-        self.get_lex(id_lex)
+        # The serialized parts of the lexeme as loaded, see save()
+        self._pristine: Dict[str, str] = {}
+        self.get_lex(id_lex, props, languages)
 
-    def get_lex(self, id_lex: str):
+    def get_lex(
+        self,
+        id_lex: str,
+        props: Optional[Iterable[str]] = None,
+        languages: Optional[Iterable[str]] = None,
+    ):
         """This function gets and returns the data of a lexeme for a given id.
 
         :param id_lex: Lexeme identifier (example: "L2")
         :type  id_lex: str
+        :param props: Only load these parts of the lexeme, see __init__()
+        :type  props: Optional[Iterable[str]]
+        :param languages: Only keep the texts in these languages
+        :type  languages: Optional[Iterable[str]]
         :returns: Simplified object representation of Lexeme
 
         """
+        props = _check_props(props)
+        entity = self.repo.get_entities([id_lex], props=_api_props(props))[id_lex]
+        if "missing" in entity:
+            raise KeyError("Lexeme {} does not exist".format(id_lex))
+
+        self._select(entity, props, languages)
 
-        PARAMS = {"action": "wbgetentities", "format": "json", "ids": id_lex}
+    def _select(
+        self,
+        entity: Dict[str, Any],
+        props: Optional[FrozenSet[str]],
+        languages: Optional[Iterable[str]],
+    ):
+        # Take over the selected parts of the entity data
+        unloaded: FrozenSet[str] = frozenset()
+        if props is not None:
+            unloaded = frozenset(self.selectable) - props
+            entity = {k: v for k, v in entity.items() if k not in unloaded}
+            for key in unloaded:
+                self.pop(key, None)
+        if languages is not None:
+            languages = frozenset(languages)
+            entity = _filter_languages(entity, languages)
+        self.update(entity)
+        self._unloaded = unloaded
+        self.languages = languages
+        self._snapshot()
+
+    def _snapshot(self):
+        # Remember the loaded parts as they are on the server
+        self._pristine = {
+            key: codec.dumps(dict.__getitem__(self, key))
+            for key in self.selectable
+            if key in self
+        }
 
-        DATA = self.repo.get(PARAMS)
+    def _update_pristine(self, key: str, update: Callable[[Any], Any]):
+        # Apply a change done on the server to the remembered part
+        if key in self._pristine:
+            value = update(codec.loads(self._pristine[key]))
+            self._pristine[key] = codec.dumps(value)
+
+    def load(self):
+        """Load all parts of the lexeme in all languages, if it is partial."""
+        if self._lazy:
+            # Not pending anymore, see WikidataSession.resolve_refs()
+            with self.repo._refs_lock:
+                self.repo._refs.pop(id(self), None)
+        if self.partial:
+            self.get_lex(self.id)
+            self._lazy = False
+
+    def __missing__(self, key: str) -> Any:
+        if self._lazy or key in self._unloaded:
+            self._load()
+            return self[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self and (self._lazy or key in self._unloaded):
+            self._load()
+        return super().get(key, default)
+
+    def _load(self):
+        if self._lazy:
+            # Load all pending handles of the session at once
+            self.repo.resolve_refs()
+        if self._lazy or self._unloaded:
+            # Keep a restriction to some languages
+            self.get_lex(self.id, languages=self.languages)
+            self._lazy = False
 
-        self.update(DATA["entities"][id_lex])
+    @property
+    def partial(self) -> bool:
+        """
+        Whether parts of the lexeme are not loaded yet, or it is restricted to
+        some languages
+
+        :rtype: bool
+        """
+        return self._lazy or bool(self._unloaded) or self.languages is not None
+
+    @classmethod
+    def ref(cls, repo: WikidataSession, id_lex: str) -> "Lexeme":
+        """Create a lazy handle of a lexeme without sending a request. It is
+        loaded on the first access to its data. Use
+        WikidataSession.lexeme_ref() to get handles that are loaded together.
+
+        :param repo: Wikidata Session
+        :type  repo: WikidataSession
+        :param id_lex: Lexeme identifier (example: "L2")
+        :type  id_lex: str
+        :rtype: Lexeme
+        """
+        lexeme = cls.from_dict(repo, {"id": id_lex})
+        lexeme._lazy = True
+        return lexeme
+
+    def _resolve(self, entity: Dict[str, Any]):
+        # Fill a lazy handle with its data, missing lexemes are marked as
+        # the API does it. Lexemes loaded in the mean time are kept.
+        if not self._lazy:
+            return
+        if "missing" in entity:
+            logging.warning("Lexeme %s does not exist", self.id)
+        self.update(entity)
+        self._lazy = False
+        self._snapshot()
+
+    @classmethod
+    def from_dict(cls, repo: Optional[WikidataSession], data: Dict) -> "Lexeme":
+        """Create a Lexeme from already fetched data without a request.
+
+        :param repo: Wikidata Session, None for lexemes that aren't bound to a
+                     session (for example when read from a dump)
+        :type  repo: Optional[WikidataSession]
+        :param data: Entity data as returned by the API
+        :type  data: Dict
+        :rtype: Lexeme
+        """
+        lexeme = cls.__new__(cls)
+        # Without a session the methods sending requests can't be used
+        Entity.__init__(lexeme, cast(WikidataSession, repo))
+        lexeme._pristine = {}
+        lexeme.update(data)
+        if repo is not None:
+            lexeme._snapshot()
+        return lexeme
+
+    @classmethod
+    def get_many(
+        cls,
+        repo: WikidataSession,
+        ids: Iterable[str],
+        workers: int = 1,
+        props: Optional[Iterable[str]] = None,
+        languages: Optional[Iterable[str]] = None,
+    ) -> List[Optional["Lexeme"]]:
+        """Load many lexemes with batched requests.
+
+        :param repo: Wikidata Session
+        :type  repo: WikidataSession
+        :param ids: Lexeme identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :param workers: Number of requests to send in parallel
+        :type  workers: int
+        :param props: Only load these parts of the lexemes, see __init__().
+                      Only leaving out "claims" makes the requests smaller.
+        :type  props: Optional[Iterable[str]]
+        :param languages: Only keep the texts in these languages, filtered
+                          locally
+        :type  languages: Optional[Iterable[str]]
+        :returns: The Lexemes in the order of the given ids. Lexemes that
+                  don't exist or got deleted are reported in the log and
+                  returned as None.
+        :rtype: List[Optional[Lexeme]]
+        """
+        ids = list(ids)
+        props = _check_props(props)
+        if workers > 1:
+            entities = repo.fetch_parallel(
+                ids, workers=workers, props=_api_props(props)
+            )
+        else:
+            entities = repo.get_entities(ids, props=_api_props(props))
+        lexemes: List[Optional[Lexeme]] = []
+        for id_lex in ids:
+            entity = entities[id_lex]
+            if "missing" in entity:
+                logging.warning("Lexeme %s does not exist", id_lex)
+                lexemes.append(None)
+            else:
+                lexeme = cls.from_dict(repo, {})
+                lexeme._select(entity, props, languages)
+                lexemes.append(lexeme)
+        return lexemes
 
     @property
     def lemma(self) -> str:
@@ -55,18 +287,36 @@ class Lexeme(Entity):
         """
         List of all forms
 
+        The forms are wrapped into Form objects in place, so modifications of
+        them change the lexeme.
+
         :rtype: List[Form]
         """
-        return [Form(self.repo, f) for f in super().get("forms", [])]
+        return self._view("forms", Form)
 
     @property
     def senses(self) -> List[Sense]:
         """
         List of all senses
 
+        The senses are wrapped into Sense objects in place, so modifications
+        of them change the lexeme.
+
         :rtype: List[Sense]
         """
-        return [Sense(self.repo, s) for s in super().get("senses", [])]
+        return self._view("senses", Sense)
+
+    def _view(self, key: str, cls: type) -> List[Any]:
+        items = self.get(key)
+        if items is None:
+            items = []
+            self[key] = items
+        if self._views.get(key) is not items:
+            for i, item in enumerate(items):
+                if not isinstance(item, cls):
+                    items[i] = cls(self.repo, item, self)
+            self._views[key] = items
+        return items
 
     def create_sense(
         self, glosses: Dict[str, str], claims: Optional[List[Claim]] = None
@@ -78,33 +328,31 @@ class Lexeme(Entity):
         :param claims: claims to add to the new form
         :rtype: str
         """
-        # Create the json with the sense's data
-        data_sense: Dict[str, Dict[str, Dict[str, str]]] = {"glosses": {}}
-        for lang, gloss in glosses.items():
-            data_sense["glosses"][lang] = {"value": gloss, "language": lang}
+        DATA = self.repo.post(self._sense_params(glosses))
+        added_sense = self._add_sense(DATA)
 
+        # Add the claims
+        if claims:
+            added_sense.add_claims(claims)
+
+        return added_sense.id
+
+    def _sense_params(self, glosses: Dict[str, str]) -> Dict[str, str]:
         # send a post to add sense to lexeme
-        PARAMS = {
+        return {
             "action": "wbladdsense",
             "format": "json",
             "lexemeId": self.id,
             "token": "__AUTO__",
             "bot": "1",
-            "data": json.dumps(data_sense),
+            "data": self.repo.codec.dumps(build_sense(glosses)),
         }
-        DATA = self.repo.post(PARAMS)
-        added_sense = Sense(self.repo, DATA["sense"])
-        id_sense = DATA["sense"]["id"]
-        logging.info("Created sense: %s", id_sense)
-
-        # Add the claims
-        if claims:
-            added_sense.add_claims(claims)
 
-        # Add the created form to the local lexeme
-        self["senses"].append(added_sense)
-
-        return id_sense
+    def _add_sense(self, DATA: Dict) -> Sense:
+        added_sense = self._add_part("senses", DATA["sense"])
+        logging.info("Created sense: %s", added_sense.id)
+        self._edited(DATA.get("lastrevid"))
+        return added_sense
 
     def create_form(
         self,
@@ -127,43 +375,82 @@ class Lexeme(Entity):
 
         """
 
+        DATA = self.repo.post(self._form_params(form, infos_gram, language))
+        added_form = self._add_form(DATA)
+
+        # Add the claims
+        if claims:
+            added_form.add_claims(claims)
+
+        return added_form.id
+
+    def _form_params(
+        self, form: str, infos_gram: List[str], language: Optional[Language] = None
+    ) -> Dict[str, str]:
         if language is None:
             languagename = self.language
         else:
             languagename = language.short
 
-        # Create the json with the forms's data
-        data_form = json.dumps(
-            {
-                "representations": {
-                    languagename: {"value": form, "language": languagename}
-                },
-                "grammaticalFeatures": infos_gram,
-            }
-        )
-
         # send a post to add form to lexeme
-        PARAMS = {
+        return {
             "action": "wbladdform",
             "format": "json",
             "lexemeId": self.id,
             "token": "__AUTO__",
             "bot": "1",
-            "data": data_form,
+            "data": self.repo.codec.dumps(
+                build_form(form, infos_gram, languagename)
+            ),
         }
-        DATA = self.repo.post(PARAMS)
-        added_form = Form(self.repo, DATA["form"])
-        id_form = DATA["form"]["id"]
-        logging.info("Created form: %s", id_form)
-
-        # Add the claims
-        if claims:
-            added_form.add_claims(claims)
 
-        # Add the created form to the local lexeme
-        self["forms"].append(added_form)
+    def _add_form(self, DATA: Dict) -> Form:
+        added_form = self._add_part("forms", DATA["form"])
+        logging.info("Created form: %s", added_form.id)
+        self._edited(DATA.get("lastrevid"))
+        return added_form
+
+    def _add_part(self, key: str, part: Dict[str, Any]) -> Any:
+        # Add a form or sense created on the server to the local lexeme. If
+        # the forms or senses weren't loaded, accessing them loads the lexeme,
+        # which then contains the new part already.
+        parts: List[Any] = self.forms if key == "forms" else self.senses
+        for existing in parts:
+            if existing.id == part["id"]:
+                return existing
+        added = (Form if key == "forms" else Sense)(self.repo, part, self)
+        parts.append(added)
+        self._update_pristine(key, lambda remembered: remembered + [part])
+        return added
+
+    def _add_claims(self, DATA: Dict):
+        super()._add_claims(DATA)
+        # The claims are now as on the server, even if they weren't loaded
+        self._unloaded = self._unloaded - {"claims"}
+        self._pristine = dict(
+            self._pristine, claims=codec.dumps(dict.__getitem__(self, "claims"))
+        )
 
-        return id_form
+    def _part_edited(self, part: Entity, lastrevid: Optional[int]):
+        # The claims of a form or sense were edited on the server: take over
+        # the new revision and the claims, in the current data as well as in
+        # the remembered one. The part is looked up by its id, since the
+        # object might not be in the lexeme anymore (for example after save()).
+        if lastrevid is not None:
+            self["lastrevid"] = lastrevid
+        key = _entity_type(part.id) + "s"
+        claims = codec.dumps(dict.__getitem__(part, "claims"))
+        for current in dict.get(self, key) or []:
+            if current is not part and current.get("id") == part.id:
+                current["claims"] = codec.loads(claims)
+
+        def update(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            for pristine in parts:
+                if pristine["id"] == part.id:
+                    pristine["claims"] = codec.loads(claims)
+            return parts
+
+        self._update_pristine(key, update)
 
     def create_claims(self, claims: Dict[str, List[str]]):
         """Add claims to the Lexeme.
@@ -183,15 +470,20 @@ class Lexeme(Entity):
     def __repr__(self) -> str:
         return "<Lexeme '{}'>".format(self.id)
 
-    def update_from_json(self, data: str, overwrite=False):
+    def update_from_json(self, data: str, overwrite=False, reload=False):
         """Update the lexeme from a json-string.
 
         This is a lower level function usable to save arbitrary modifications
         on a lexeme. The data has to be supplied in the right format by the
         user.
 
+        The local lexeme is updated from the entity returned by the API. Parts
+        missing in the answer are reloaded on their first access – or right
+        away if reload is set.
+
         :param data: Data update: See the API documentation about the format.
         :param overwrite: If set the whole entity is replaced by the supplied data
+        :param reload: If set, parts missing in the answer are reloaded at once
         """
         PARAMS: Dict[str, str] = {
             "action": "wbeditentity",
@@ -204,9 +496,187 @@ class Lexeme(Entity):
         if overwrite:
             PARAMS["clear"] = "true"
         DATA = self.repo.post(PARAMS)
-        if DATA.get("success") != 200:
+        if DATA.get("success") != 1:
             raise ValueError(DATA)
         logging.info("Updated from json data")
-        # Due to limitations of the API, the returned data cannot be used to
-        # update the instance. Therefore, reload the lexeme.
-        self.get_lex(self.id)
+        self._update_from_answer(DATA.get("entity", {}))
+        if reload and self._unloaded:
+            self.get_lex(self.id)
+
+    def _update_from_answer(self, entity: Dict[str, Any]):
+        # Take over the data returned after an edit, everything else might be
+        # outdated and is marked to be reloaded when it is needed. The answer
+        # contains all languages, keep a restriction to some of them.
+        if self.languages is not None:
+            entity = _filter_languages(entity, self.languages)
+        outdated = [key for key in self if key not in entity and key != "id"]
+        for key in outdated:
+            del self[key]
+        self.update(entity)
+        self._unloaded = self._unloaded.union(outdated)
+        self._snapshot()
+
+    def changes(self) -> Dict[str, Any]:
+        """The local modifications of the lexeme since it was loaded, in the
+        format of wbeditentity: changed lemmas, lexical category and language;
+        added, changed and removed claims, forms and senses.
+
+        :rtype: Dict[str, Any]
+        """
+        changes: Dict[str, Any] = {}
+        for key in self.selectable:
+            if key not in self:
+                # Not loaded, so not modified
+                continue
+            old = self._pristine.get(key)
+            old = codec.loads(old) if old is not None else None
+            new = dict.__getitem__(self, key)
+            change: Any
+            if key == "lemmas":
+                change = _terms_changes(old or {}, new)
+            elif key == "claims":
+                change = _claims_changes(old, new)
+            elif key in ("forms", "senses"):
+                change = _parts_changes(old or [], new)
+            else:
+                change = new if new != old else None
+            if change:
+                changes[key] = change
+        return changes
+
+    def save(self) -> bool:
+        """Upload the local modifications of the lexeme with one edit.
+
+        Only the changes since the lexeme was loaded (or saved) are sent, see
+        changes(). The edit is based on the loaded revision, so the API
+        refuses it with an edit conflict, if the lexeme was modified by
+        someone else in the mean time.
+
+        :returns: Whether there were modifications to upload
+        :rtype: bool
+        """
+        changes = self.changes()
+        if not changes:
+            return False
+        PARAMS: Dict[str, str] = {
+            "action": "wbeditentity",
+            "format": "json",
+            "bot": "1",
+            "id": self.id,
+            "token": "__AUTO__",
+            "data": self.repo.codec.dumps(changes),
+        }
+        if "lastrevid" in self:
+            PARAMS["baserevid"] = str(dict.__getitem__(self, "lastrevid"))
+        DATA = self.repo.post(PARAMS)
+        if DATA.get("success") != 1:
+            raise ValueError(DATA)
+        logging.info("Saved lexeme %s", self.id)
+        self._update_from_answer(DATA.get("entity", {}))
+        return True
+
+
+def _check_props(props: Optional[Iterable[str]]) -> Optional[FrozenSet[str]]:
+    if props is None:
+        return None
+    props = frozenset(props)
+    unknown = props - frozenset(Lexeme.selectable)
+    if unknown:
+        raise ValueError("Parts of lexemes that can't be selected: {}".format(unknown))
+    return props
+
+
+def _api_props(props: Optional[FrozenSet[str]]) -> Optional[List[str]]:
+    # The API can leave out only the claims of a lexeme, the other parts are
+    # selected locally. Without a selection the entity caches are used.
+    if props is None or "claims" in props:
+        return None
+    return ["info"]
+
+
+def _filter_languages(
+    entity: Dict[str, Any], languages: FrozenSet[str]
+) -> Dict[str, Any]:
+    # Copy of the entity data with only the texts in the given languages
+    def texts(values: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in values.items() if k in languages}
+
+    entity = dict(entity)
+    if "lemmas" in entity:
+        entity["lemmas"] = texts(entity["lemmas"])
+    for key, field in (("forms", "representations"), ("senses", "glosses")):
+        if key in entity:
+            entity[key] = [
+                dict(part, **{field: texts(part.get(field, {}))})
+                for part in entity[key]
+            ]
+    return entity
+
+
+def _terms_changes(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    # Changed and removed lemmas, representations or glosses
+    changes = {lang: term for lang, term in new.items() if old.get(lang) != term}
+    for lang in old:
+        if lang not in new:
+            changes[lang] = {"language": lang, "remove": ""}
+    return changes
+
+
+def _claims_changes(old: Any, new: Any) -> List[Dict[str, Any]]:
+    # Added, changed and removed claims. The API returns an empty list if
+    # there are no claims.
+    old_claims = {
+        claim["id"]: claim for claims in (old or {}).values() for claim in claims
+    }
+    changes: List[Dict[str, Any]] = []
+    kept = set()
+    for claims in (new or {}).values():
+        for claim in claims:
+            claim_id = claim.get("id")
+            if claim_id is None:
+                changes.append(dict(claim, type="statement"))
+            else:
+                kept.add(claim_id)
+                if old_claims.get(claim_id) != claim:
+                    changes.append(claim)
+    for claim_id in old_claims:
+        if claim_id not in kept:
+            changes.append({"id": claim_id, "remove": ""})
+    return changes
+
+
+def _parts_changes(
+    old: List[Dict[str, Any]], new: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    # Added, changed and removed forms or senses
+    old_parts = {part["id"]: part for part in old}
+    changes: List[Dict[str, Any]] = []
+    kept = set()
+    for part in new:
+        part_id = part.get("id")
+        if part_id is None:
+            added = dict(part, add="")
+            if isinstance(part.get("claims"), dict):
+                added["claims"] = _claims_changes(None, part["claims"])
+            changes.append(added)
+            continue
+        kept.add(part_id)
+        previous = old_parts.get(part_id, {})
+        change: Dict[str, Any] = {"id": part_id}
+        for key in ("representations", "glosses"):
+            if key in part:
+                terms = _terms_changes(previous.get(key, {}), part[key])
+                if terms:
+                    change[key] = terms
+        features = part.get("grammaticalFeatures")
+        if features is not None and features != previous.get("grammaticalFeatures"):
+            change["grammaticalFeatures"] = features
+        claims = _claims_changes(previous.get("claims"), part.get("claims"))
+        if claims:
+            change["claims"] = claims
+        if len(change) > 1:
+            changes.append(change)
+    for part_id in old_parts:
+        if part_id not in kept:
+            changes.append({"id": part_id, "remove": ""})
+    return changes
@@ -0,0 +1,221 @@
+import bisect
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+# Upper bounds of the latency histogram buckets in seconds
+default_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _ActionMetrics:
+    __slots__ = (
+        "count",
+        "latency_sum",
+        "latency_counts",
+        "bytes_sent",
+        "bytes_received",
+        "bytes_decoded",
+        "retries",
+        "maxlag_sleep",
+        "errors",
+    )
+
+    def __init__(self, buckets: int):
+        self.count = 0
+        self.latency_sum = 0.0
+        # Non-cumulative counts, the last one is for +Inf
+        self.latency_counts = [0] * (buckets + 1)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.retries = 0
+        self.maxlag_sleep = 0.0
+        self.errors: Counter = Counter()
+
+
+class Metrics:
+    """Counters of the requests sent by a session, by API action.
+
+    For every action (wbgetentities, wbeditentity, …) the number of requests,
+    a histogram of their latency, the bytes sent and received (on the wire and
+    after decompression), the retries, the time paused because of maxlag and
+    the error codes are recorded.
+    Recording only updates a few counters, so it can be left on.
+
+    Usage::
+
+        repo = WikidataSession()
+        …
+        print(repo.metrics.snapshot()["wbgetentities"]["count"])
+        print(repo.metrics.to_prometheus())
+    """
+
+    def __init__(self, buckets: Sequence[float] = default_buckets):
+        """
+        :param buckets: Upper bounds of the latency histogram in seconds
+        """
+        self.buckets = sorted(buckets)
+        self.lock = threading.Lock()
+        self.actions: Dict[str, _ActionMetrics] = {}
+
+    def _action(self, action: str) -> _ActionMetrics:
+        # Has to be called with the lock held
+        metrics = self.actions.get(action)
+        if metrics is None:
+            metrics = self.actions[action] = _ActionMetrics(len(self.buckets))
+        return metrics
+
+    def record(
+        self,
+        action: str,
+        latency: float,
+        sent: int,
+        received: int,
+        decoded: Optional[int] = None,
+    ):
+        """
+        Record a request
+
+        :param action: API action of the request
+        :param latency: Seconds until the response was received
+        :param sent: Bytes sent
+        :param received: Bytes received, compressed as transferred
+        :param decoded: Bytes received after decompression, by default the
+                        same as received
+        """
+        bucket = bisect.bisect_left(self.buckets, latency)
+        with self.lock:
+            metrics = self._action(action)
+            metrics.count += 1
+            metrics.latency_sum += latency
+            metrics.latency_counts[bucket] += 1
+            metrics.bytes_sent += sent
+            metrics.bytes_received += received
+            metrics.bytes_decoded += received if decoded is None else decoded
+
+    def record_retry(self, action: str, sleep: float):
+        """
+        Record a request that is repeated because the servers are lagging
+
+        :param action: API action of the request
+        :param sleep: Seconds paused before the repetition
+        """
+        with self.lock:
+            metrics = self._action(action)
+            metrics.retries += 1
+            metrics.maxlag_sleep += sleep
+
+    def record_error(self, action: str, code: str):
+        """
+        Record an error returned by the API
+
+        :param action: API action of the request
+        :param code: Error code of the API or HTTP status code
+        """
+        with self.lock:
+            self._action(action).errors[code] += 1
+
+    def reset(self):
+        """Set all counters to zero"""
+        with self.lock:
+            self.actions.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Current values of all counters
+
+        :returns: The metrics by action. The latency buckets are cumulative
+                  and keyed by their upper bound, like in Prometheus.
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        snapshot = {}
+        with self.lock:
+            for action, metrics in self.actions.items():
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(
+                    self.buckets + [float("inf")], metrics.latency_counts
+                ):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                snapshot[action] = {
+                    "count": metrics.count,
+                    "latency_sum": metrics.latency_sum,
+                    "latency_buckets": buckets,
+                    "bytes_sent": metrics.bytes_sent,
+                    "bytes_received": metrics.bytes_received,
+                    "bytes_decoded": metrics.bytes_decoded,
+                    "retries": metrics.retries,
+                    "maxlag_sleep": metrics.maxlag_sleep,
+                    "errors": dict(metrics.errors),
+                }
+        return snapshot
+
+    def to_prometheus(self, prefix: str = "lexdata") -> str:
+        """
+        Export the metrics in the Prometheus text format
+
+        :param prefix: Prefix of the metric names
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, description: str, key: str):
+            lines.append("# HELP {}_{} {}".format(prefix, name, description))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+            for action, values in snapshot.items():
+                lines.append(
+                    '{}_{}{{action="{}"}} {}'.format(prefix, name, action, values[key])
+                )
+
+        metric("requests_total", "counter", "Number of API requests.", "count")
+        name = prefix + "_request_duration_seconds"
+        lines.append("# HELP {} Latency of API requests.".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for action, values in snapshot.items():
+            for bound, count in values["latency_buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    '{}_bucket{{action="{}",le="{}"}} {}'.format(name, action, le, count)
+                )
+            lines.append(
+                '{}_sum{{action="{}"}} {}'.format(name, action, values["latency_sum"])
+            )
+            lines.append(
+                '{}_count{{action="{}"}} {}'.format(name, action, values["count"])
+            )
+        metric("sent_bytes_total", "counter", "Bytes sent to the API.", "bytes_sent")
+        metric(
+            "received_bytes_total",
+            "counter",
+            "Bytes received from the API.",
+            "bytes_received",
+        )
+        metric(
+            "decoded_bytes_total",
+            "counter",
+            "Bytes received from the API after decompression.",
+            "bytes_decoded",
+        )
+        metric(
+            "retries_total",
+            "counter",
+            "Requests repeated because of maxlag or overload.",
+            "retries",
+        )
+        metric(
+            "maxlag_sleep_seconds_total",
+            "counter",
+            "Time paused because of maxlag or overload.",
+            "maxlag_sleep",
+        )
+        name = prefix + "_errors_total"
+        lines.append("# HELP {} Errors returned by the API.".format(name))
+        lines.append("# TYPE {} counter".format(name))
+        for action, values in snapshot.items():
+            for code, count in values["errors"].items():
+                lines.append(
+                    '{}{{action="{}",code="{}"}} {}'.format(name, action, code, count)
+                )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,329 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from .codec import codec
+from .language import Language
+from .lexeme import Lexeme
+from .wikidatasession import WikidataSession
+
+# Namespace of the lexemes on Wikidata
+LEXEME_NAMESPACE = 146
+# Time the recent changes are kept by MediaWiki
+_rc_max_age = timedelta(days=30)
+
+
+def _timestamp(time: datetime) -> str:
+    # Timestamp in the format of the API
+    return time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class LexemeMirror:
+    """Local copy of lexemes stored in a SQLite database, kept up to date
+    incrementally.
+
+    sync() pages through the recent changes of the Lexeme namespace since
+    the last checkpoint and refetches only the lexemes touched since then.
+    Deleted lexemes are removed, merged lexemes (redirects) are replaced by
+    their target. The cost of a sync thereby depends on the number of edits,
+    not on the size of the mirror. MediaWiki keeps the recent changes for 30
+    days, mirrors that weren't synced for longer have to be rebuilt.
+
+    Usage::
+
+        mirror = LexemeMirror(repo, "lexemes.sqlite", languages=[lang_nb])
+        mirror.build_from_dump("latest-lexemes.json.gz")
+        …
+        mirror.sync()
+        lexeme = mirror.get("L2")
+
+    If the session has a lemma index, it is kept up to date as well.
+    """
+
+    def __init__(
+        self,
+        repo: WikidataSession,
+        path: str,
+        languages: Optional[Iterable[Union[Language, str]]] = None,
+    ):
+        """
+        :param repo: Wikidata Session to fetch the lexemes with
+        :param path: File name of the database
+        :param languages: Only mirror lexemes of these languages (Language
+                          objects or QIDs)
+        """
+        self.repo = repo
+        self.path = path
+        self.languages = None
+        if languages is not None:
+            self.languages = {
+                lang.qid if isinstance(lang, Language) else lang for lang in languages
+            }
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS lexemes ("
+                "id TEXT PRIMARY KEY, language TEXT, lastrevid INTEGER, data TEXT)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @property
+    def checkpoint(self) -> Optional[str]:
+        """
+        Timestamp up to which the changes are applied to the mirror, None if
+        it was never filled
+
+        :rtype: Optional[str]
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM meta WHERE key = 'checkpoint'"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    @checkpoint.setter
+    def checkpoint(self, value: str):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('checkpoint', ?)", (value,)
+            )
+
+    def _wanted(self, entity: Dict[str, Any]) -> bool:
+        return self.languages is None or entity.get("language") in self.languages
+
+    def _store(self, entities: Iterable[Dict[str, Any]]) -> int:
+        # Store lexemes of the mirrored languages, remove the others
+        stored = []
+        removed = []
+        for entity in entities:
+            if self._wanted(entity):
+                stored.append(entity)
+            else:
+                removed.append(entity["id"])
+        rows = [
+            (e["id"], e.get("language"), e.get("lastrevid"), codec.dumps(e))
+            for e in stored
+        ]
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO lexemes VALUES (?, ?, ?, ?)", rows
+            )
+        self.remove(removed)
+        if self.repo.lemma_index is not None:
+            self.repo.lemma_index.add(stored)
+        return len(stored)
+
+    def remove(self, ids: Iterable[str]):
+        """
+        Remove lexemes from the mirror
+
+        :param ids: Lexeme identifiers
+        """
+        ids = list(ids)
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM lexemes WHERE id = ?", [(i,) for i in ids])
+        if self.repo.lemma_index is not None:
+            self.repo.lemma_index.remove(ids)
+
+    def add(self, ids: Iterable[str], workers: int = 1) -> int:
+        """
+        Fetch lexemes and add them to the mirror
+
+        :param ids: Lexeme identifiers
+        :param workers: Number of requests to send in parallel
+        :returns: Number of lexemes added, lexemes of other languages are
+                  skipped
+        :rtype: int
+        """
+        if self.checkpoint is None:
+            self.checkpoint = _timestamp(datetime.now(timezone.utc))
+        entities = self.repo.fetch_parallel(ids, workers=workers)
+        return self._store(e for e in entities.values() if "missing" not in e)
+
+    def build_from_dump(self, path: str, batch_size: int = 10000):
+        """
+        Add all lexemes of a dump to the mirror. The checkpoint is set to the
+        time of the latest edit in the dump, so that the next sync() applies
+        all changes since then.
+
+        :param path: File name of the dump, see LexData.dump.DumpReader
+        :param batch_size: Number of lexemes to add per transaction
+        """
+        from .dump import DumpReader
+
+        latest = ""
+        batch: List[Dict[str, Any]] = []
+        for entity in DumpReader(path, self.languages).entities():
+            latest = max(latest, entity.get("modified", ""))
+            batch.append(entity)
+            if len(batch) >= batch_size:
+                self._store(batch)
+                batch = []
+        self._store(batch)
+        if latest:
+            self.checkpoint = latest
+
+    def sync(self, workers: int = 1) -> Dict[str, int]:
+        """
+        Apply the changes since the last checkpoint to the mirror
+
+        :param workers: Number of requests to send in parallel
+        :returns: Number of changes seen, lexemes updated and removed
+        :rtype: Dict[str, int]
+        """
+        checkpoint = self.checkpoint
+        if checkpoint is None:
+            raise ValueError("The mirror is empty, fill it with add() first")
+        if checkpoint < _timestamp(datetime.now(timezone.utc) - _rc_max_age):
+            logging.warning(
+                "Mirror %s was last synced at %s, older changes are lost",
+                self.path,
+                checkpoint,
+            )
+
+        PARAMS = {
+            "action": "query",
+            "format": "json",
+            "list": "recentchanges",
+            "rcnamespace": str(LEXEME_NAMESPACE),
+            "rcprop": "title|ids|timestamp|loginfo",
+            "rctype": "edit|new|log",
+            "rcdir": "newer",
+            "rcstart": checkpoint,
+            "rclimit": "max",
+        }
+        # The latest revision seen by lexeme, 0 for log entries
+        touched: Dict[str, int] = {}
+        created: Set[str] = set()
+        deleted: Set[str] = set()
+        changes = 0
+        while True:
+            DATA = self.repo.get(PARAMS)
+            for change in DATA["query"]["recentchanges"]:
+                changes += 1
+                checkpoint = max(checkpoint, change["timestamp"])
+                lexeme_id = change["title"].split(":")[-1]
+                if change["type"] == "log" and change.get("logtype") == "delete":
+                    if change.get("logaction") == "delete":
+                        deleted.add(lexeme_id)
+                        touched.pop(lexeme_id, None)
+                        continue
+                    # Restored lexemes are new to the mirror
+                    created.add(lexeme_id)
+                elif change["type"] == "new":
+                    created.add(lexeme_id)
+                deleted.discard(lexeme_id)
+                touched[lexeme_id] = max(
+                    touched.get(lexeme_id, 0), change.get("revid", 0)
+                )
+            if "continue" not in DATA:
+                break
+            PARAMS.update(DATA["continue"])
+
+        fetch = self._outdated(touched, created)
+        entities = self.repo.fetch_parallel(fetch, workers=workers)
+        removed = set(deleted)
+        updated = []
+        for lexeme_id, entity in entities.items():
+            if "missing" in entity:
+                removed.add(lexeme_id)
+                continue
+            if entity.get("redirects") is not None:
+                # Merged into another lexeme, which is stored instead
+                removed.add(lexeme_id)
+                entity = {k: v for k, v in entity.items() if k != "redirects"}
+            updated.append(entity)
+        self.remove(removed)
+        stored = self._store(updated)
+        self.checkpoint = checkpoint
+        logging.info(
+            "Synced mirror %s: %d changes, %d updated, %d removed",
+            self.path,
+            changes,
+            stored,
+            len(removed),
+        )
+        return {"changes": changes, "updated": stored, "removed": len(removed)}
+
+    def _outdated(self, touched: Dict[str, int], created: Set[str]) -> List[str]:
+        # The touched lexemes whose stored revision is older than the latest
+        # change. If only some languages are mirrored, unknown lexemes are
+        # only fetched if they are new.
+        with self.lock:
+            known: Dict[str, int] = {}
+            ids = list(touched)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                cursor = self.db.execute(
+                    "SELECT id, lastrevid FROM lexemes WHERE id IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                )
+                known.update(cursor.fetchall())
+        outdated = []
+        for lexeme_id, revid in touched.items():
+            if lexeme_id in known:
+                if not revid or known[lexeme_id] < revid:
+                    outdated.append(lexeme_id)
+            elif self.languages is None or lexeme_id in created:
+                outdated.append(lexeme_id)
+        return outdated
+
+    def get(self, lexeme_id: str) -> Optional[Lexeme]:
+        """
+        Get a lexeme from the mirror
+
+        :param lexeme_id: Lexeme identifier (example: "L2")
+        :returns: The Lexeme bound to the session of the mirror, None if it
+                  is not mirrored
+        :rtype: Optional[Lexeme]
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM lexemes WHERE id = ?", (lexeme_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Lexeme.from_dict(self.repo, codec.loads(row[0]))
+
+    def entities(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the raw data of all mirrored lexemes
+
+        :rtype: Iterator[Dict[str, Any]]
+        """
+        last = 0
+        while True:
+            # In batches, so that the lock isn't held while iterating
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT rowid, data FROM lexemes WHERE rowid > ? "
+                    "ORDER BY rowid LIMIT 1000",
+                    (last,),
+                ).fetchall()
+            if not rows:
+                return
+            for last, data in rows:
+                yield codec.loads(data)
+
+    def __iter__(self) -> Iterator[Lexeme]:
+        for entity in self.entities():
+            yield Lexeme.from_dict(self.repo, entity)
+
+    def __contains__(self, lexeme_id: object) -> bool:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT 1 FROM lexemes WHERE id = ?", (lexeme_id,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = self.db.execute("SELECT count(*) FROM lexemes").fetchone()
+        return count
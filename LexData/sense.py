@@ -1,15 +1,27 @@
-from typing import Dict
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
-from .entity import Entity
+from .entity import Entity, build_claims
 from .wikidatasession import WikidataSession
 
+if TYPE_CHECKING:
+    from .lexeme import Lexeme
+
 
 class Sense(Entity):
     """Wrapper around a dict to represent a Sense"""
 
-    def __init__(self, repo: WikidataSession, form: Dict):
+    def __init__(
+        self, repo: WikidataSession, form: Dict, lexeme: Optional["Lexeme"] = None
+    ):
         super().__init__(repo)
         self.update(form)
+        # The lexeme the sense belongs to, updated when the sense is edited
+        self.lexeme = lexeme
+
+    def _edited(self, lastrevid: Optional[int]):
+        # The revision belongs to the lexeme, not to the sense
+        if self.lexeme is not None:
+            self.lexeme._part_edited(self, lastrevid)
 
     def glosse(self, lang: str = "en") -> str:
         """
@@ -29,3 +41,19 @@ class Sense(Entity):
 
     def __repr__(self) -> str:
         return "<Sense '{}'>".format(self.glosse())
+
+
+def build_sense(glosses: Dict[str, str], claims: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Build the json of a new sense as expected by the API.
+
+    :param glosses: glosses by language code
+    :param claims: claims of the sense, see Entity.add_claims()
+    :rtype: Dict[str, Any]
+    """
+    data_sense: Dict[str, Any] = {"glosses": {}}
+    for lang, gloss in glosses.items():
+        data_sense["glosses"][lang] = {"value": gloss, "language": lang}
+    if claims:
+        data_sense["claims"] = build_claims(claims)
+    return data_sense
@@ -0,0 +1,195 @@
+"""
+Client of the Wikidata Query Service, to resolve many lemmas at once.
+
+Searching lexemes with wbsearchentities needs one request per lemma plus
+the requests to check the candidates. A SPARQL query with a VALUES block
+resolves hundreds of (lemma, language, lexical category) keys at once::
+
+    sparql = SparqlClient()
+    ids = sparql.resolve_lexemes([("water", lang_en, "Q1084"), …])
+    ids[("water", "Q1860", "Q1084")]  # ["L3302"]
+
+The query service lags behind the edits by some minutes, lexemes created
+recently might not be found yet.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from .codec import JSONCodec, default_codec
+from .language import Language
+from .throttle import AdaptiveThrottle, retry_after
+from .version import user_agent
+
+
+class SparqlClient:
+    """Client of a SPARQL endpoint, by default the Wikidata Query Service.
+
+    Like WikidataSession it can be used from many threads, and the number of
+    concurrent queries adapts to the load of the servers.
+    """
+
+    URL: str = "https://query.wikidata.org/sparql"
+    # Number of times a query is repeated because of overload, before giving
+    # up
+    max_retries: int = 10
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        user_agent: str = user_agent,
+        chunk_size: int = 200,
+        workers: int = 2,
+        throttle: Optional[AdaptiveThrottle] = None,
+        codec: Optional[JSONCodec] = None,
+    ):
+        """
+        :param url: URL of the endpoint, by default the Wikidata Query Service
+        :param chunk_size: Number of keys resolved by one query
+        :param workers: Number of queries to send in parallel
+        :param throttle: Limit of concurrent queries
+        :param codec: Encoder and decoder of JSON, see default_codec()
+        """
+        if url is not None:
+            self.URL = url
+        self.headers = {
+            "User-Agent": user_agent,
+            "Accept": "application/sparql-results+json",
+        }
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.throttle = throttle or AdaptiveThrottle(initial=workers)
+        self.codec = codec or default_codec()
+        self._local = threading.local()
+
+    @property
+    def S(self) -> requests.Session:
+        """
+        The HTTP session of the current thread
+
+        :rtype: requests.Session
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def query(self, query: str) -> List[Dict[str, Any]]:
+        """Run a SELECT query
+
+        :param query: The SPARQL query
+        :type  query: str
+        :returns: The bindings of the results by variable name
+        :rtype: List[Dict[str, Any]]
+
+        """
+        for retries in count():
+            with self.throttle:
+                # POST, since queries with VALUES blocks get long
+                R = self.S.post(self.URL, data={"query": query}, headers=self.headers)
+            if R.status_code in (429, 503):
+                if retries >= self.max_retries:
+                    raise Exception(
+                        "Query failed after {} retries, the query service is "
+                        "overloaded ({})".format(retries, R.status_code)
+                    )
+                sleepfor = retry_after(R.headers)
+                logging.info(
+                    "Query service overloaded, waiting for %.1f seconds", sleepfor
+                )
+                self.throttle.backoff(sleepfor)
+                continue
+            if R.status_code != 200:
+                raise Exception(
+                    "Query was unsuccessfull ({}): {}".format(R.status_code, R.text)
+                )
+            break
+        self.throttle.success()
+        return self.codec.loads(R.content)["results"]["bindings"]
+
+    def resolve_lexemes(
+        self, entries: Iterable[Tuple[str, Language, str]]
+    ) -> Dict[Tuple[str, str, str], List[str]]:
+        """Find the lexemes with the given lemmas, languages and lexical
+        categories. The keys are deduplicated and resolved by chunked queries
+        sent in parallel.
+
+        The lemma has to be in the language code of the Language (for
+        example "water"@en), like lexemes created by LexData.
+
+        :param entries: (lemma, language, lexical category) of the lexemes
+        :type  entries: Iterable[Tuple[str, Language, str]]
+        :returns: The ids of the matching lexemes by (lemma, language QID,
+                  lexical category), like search_lexeme_ids() returns them
+        :rtype: Dict[Tuple[str, str, str], List[str]]
+
+        """
+        languages: Dict[Tuple[str, str, str], Language] = {}
+        for lemma, lang, catLex in entries:
+            languages.setdefault((lemma, lang.qid, catLex), lang)
+        keys = list(languages)
+        chunks = [
+            keys[i : i + self.chunk_size]
+            for i in range(0, len(keys), self.chunk_size)
+        ]
+
+        def resolve(chunk: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+            values = "\n".join(
+                "({}@{} wd:{} wd:{})".format(
+                    _literal(lemma), languages[lemma, qid, catLex].short, qid, catLex
+                )
+                for lemma, qid, catLex in chunk
+            )
+            return self.query(_lexeme_query.format(values))
+
+        ids: Dict[Tuple[str, str, str], List[str]] = {key: [] for key in keys}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for bindings in executor.map(resolve, chunks):
+                for binding in bindings:
+                    key = (
+                        binding["lemma"]["value"],
+                        _entity_id(binding["language"]["value"]),
+                        _entity_id(binding["category"]["value"]),
+                    )
+                    if key in ids:
+                        ids[key].append(_entity_id(binding["lexeme"]["value"]))
+        for lexeme_ids in ids.values():
+            lexeme_ids.sort(key=lambda i: int(i[1:]))
+        return ids
+
+
+# The prefixes are declared, since other endpoints than the Wikidata Query
+# Service don't know them
+_lexeme_query = """
+PREFIX wd: <http://www.wikidata.org/entity/>
+PREFIX dct: <http://purl.org/dc/terms/>
+PREFIX wikibase: <http://wikiba.se/ontology#>
+SELECT ?lemma ?language ?category ?lexeme WHERE {{
+  VALUES (?lemma ?language ?category) {{
+{}
+  }}
+  ?lexeme dct:language ?language;
+          wikibase:lexicalCategory ?category;
+          wikibase:lemma ?lemma.
+}}
+"""
+
+
+def _literal(value: str) -> str:
+    # Quote a string as SPARQL literal
+    escaped = (
+        value.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+    return '"{}"'.format(escaped)
+
+
+def _entity_id(uri: str) -> str:
+    # http://www.wikidata.org/entity/L2 → L2
+    return uri.rsplit("/", 1)[-1]
@@ -0,0 +1,143 @@
+import asyncio
+import math
+import threading
+import time
+from typing import List, Mapping, Tuple
+
+
+class AdaptiveThrottle:
+    """Limit of concurrent requests shared by all threads and tasks using a
+    session.
+
+    The limit adapts to the load of the servers: it is cut multiplicatively
+    whenever the API reports maxlag or answers with 429/503, and all
+    requests pause for the time the server asks for. While requests succeed,
+    the limit rises by one per limit successful requests. This gets the most
+    throughput the cluster allows without tripping the lag.
+
+    It is used as a context manager around each request::
+
+        with throttle:
+            R = session.get(…)
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 32,
+        decrease: float = 0.5,
+    ):
+        """
+        :param initial: Number of concurrent requests at the start
+        :param minimum: Lowest number of concurrent requests
+        :param maximum: Highest number of concurrent requests
+        :param decrease: Factor to cut the limit by on backoff
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.active = 0
+        self.paused_until = 0.0
+        self._condition = threading.Condition()
+        # Event loops and events of the tasks waiting in acquire_async()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _try_acquire(self) -> float:
+        # Take a slot if possible and return 0, otherwise return the time to
+        # wait: the rest of the pause or inf until a slot is released
+        with self._condition:
+            now = time.monotonic()
+            if self.paused_until > now:
+                return self.paused_until - now
+            if self.active < int(self.limit):
+                self.active += 1
+                return 0
+            return math.inf
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    self._condition.wait(self.paused_until - now)
+                elif self.active < int(self.limit):
+                    self.active += 1
+                    return
+                else:
+                    self._condition.wait()
+
+    async def acquire_async(self):
+        """Wait until a request may be sent, without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            event = asyncio.Event()
+            waiter = (loop, event)
+            # Registered before trying, so that no release is missed
+            with self._condition:
+                self._waiters.append(waiter)
+            try:
+                wait = self._try_acquire()
+                if not wait:
+                    return
+                await asyncio.wait_for(event.wait(), None if wait == math.inf else wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def _notify(self):
+        # Wake up the threads and tasks waiting for a slot, has to be called
+        # with the lock held
+        self._condition.notify_all()
+        for loop, event in self._waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+        self._waiters.clear()
+
+    def release(self):
+        """Free the slot of a finished request"""
+        with self._condition:
+            self.active -= 1
+            self._notify()
+
+    def success(self):
+        """Report a successful request, slowly raising the limit"""
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._notify()
+
+    def backoff(self, retry_after: float):
+        """
+        Report an overloaded server: cut the limit and pause all requests
+
+        :param retry_after: Seconds to pause, as requested by the server
+        """
+        with self._condition:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def __enter__(self) -> "AdaptiveThrottle":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def retry_after(headers: Mapping[str, str], default: float = 5) -> float:
+    """
+    Seconds to wait according to the Retry-After header of a response
+
+    :param headers: Headers of the response
+    :param default: Used if the header is missing or gives a date
+    :rtype: float
+    """
+    try:
+        return float(headers.get("retry-after", default))
+    except ValueError:
+        return default
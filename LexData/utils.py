@@ -1,25 +1,121 @@
-import functools
 import json
+import os
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional
 
 from .wikidatasession import WikidataSession
 
+# Datatypes of properties by URL of the API. The bundled snapshot of commonly
+# used ones only applies to Wikidata.
+_property_types: Dict[str, Dict[str, str]] = {}
+_property_types_lock = threading.Lock()
+_property_type_db: Optional[sqlite3.Connection] = None
+_default_repo: Optional[WikidataSession] = None
 
-@functools.lru_cache()
-def get_property_type(property_id: str):
-    repo = WikidataSession()
-    query = {
-        "action": "query",
-        "format": "json",
-        "prop": "revisions",
-        "titles": "Property:" + property_id,
-        "rvprop": "content",
-    }
-    DATA = repo.get(query)
-    json_str = list(DATA["query"]["pages"].values())[0]["revisions"][0]["*"]
-    content = json.loads(json_str)
-    return content["datatype"]
+
+def _load_property_types():
+    path = os.path.join(os.path.dirname(__file__), "property_types.json")
+    with open(path) as f:
+        _property_types[WikidataSession.URL] = json.load(f)
+
+
+_load_property_types()
+
+
+def use_property_type_cache(path: str):
+    """Store the datatypes of properties in a SQLite database, that can be
+    shared by many processes and survives restarts. Datatypes the process
+    doesn't know yet are looked up in the database before they are requested
+    from the API.
+
+    :param path: File name of the database
+    """
+    global _property_type_db
+    with _property_types_lock:
+        _property_type_db = sqlite3.connect(path, check_same_thread=False)
+        with _property_type_db:
+            _property_type_db.execute(
+                "CREATE TABLE IF NOT EXISTS property_types "
+                "(url TEXT, id TEXT, datatype TEXT, PRIMARY KEY (url, id))"
+            )
+
+
+def _stored_property_types(url: str, property_ids: List[str]) -> Dict[str, str]:
+    # Datatypes found in the database, has to be called with the lock held
+    stored: Dict[str, str] = {}
+    if _property_type_db is None:
+        return stored
+    for i in range(0, len(property_ids), 500):
+        chunk = property_ids[i : i + 500]
+        cursor = _property_type_db.execute(
+            "SELECT id, datatype FROM property_types "
+            "WHERE url = ? AND id IN ({})".format(",".join("?" * len(chunk))),
+            [url] + chunk,
+        )
+        stored.update(cursor.fetchall())
+    return stored
+
+
+def get_property_types(
+    property_ids: Iterable[str], repo: Optional[WikidataSession] = None
+) -> Dict[str, str]:
+    """Get the datatypes of many properties. Unknown datatypes are fetched
+    with as few requests as possible – use it to prefetch the datatypes
+    before building many claims.
+
+    The datatypes are remembered per wiki (by the URL of the API of the
+    session).
+
+    :param property_ids: Property identifiers (example: ["P31", "P5137"])
+    :param repo: Session to use for the requests, by default one of Wikidata
+    :returns: Datatype by property id
+    :rtype: Dict[str, str]
+    """
+    global _default_repo
+    property_ids = list(property_ids)
+    url = repo.URL if repo is not None else WikidataSession.URL
+    with _property_types_lock:
+        known = _property_types.setdefault(url, {})
+        missing = [p for p in property_ids if p not in known]
+        if missing:
+            # Another process might have fetched them already
+            known.update(_stored_property_types(url, missing))
+            missing = [p for p in missing if p not in known]
+    if missing:
+        if repo is None:
+            if _default_repo is None:
+                _default_repo = WikidataSession()
+            repo = _default_repo
+        fetched = {}
+        for property_id, entity in repo.get_entities(
+            missing, props=["datatype"]
+        ).items():
+            if "missing" in entity:
+                raise KeyError("Property {} does not exist".format(property_id))
+            fetched[property_id] = entity["datatype"]
+        with _property_types_lock:
+            known.update(fetched)
+            if _property_type_db is not None:
+                with _property_type_db:
+                    _property_type_db.executemany(
+                        "INSERT OR REPLACE INTO property_types VALUES (?, ?, ?)",
+                        [(url, p, datatype) for p, datatype in fetched.items()],
+                    )
+    return {p: known[p] for p in property_ids}
+
+
+def get_property_type(
+    property_id: str, repo: Optional[WikidataSession] = None
+) -> str:
+    """Get the datatype of a property
+
+    :param property_id: Property identifier (example: "P31")
+    :param repo: Session to use for the request if the datatype is unknown
+    :rtype: str
+    """
+    return get_property_types([property_id], repo)[property_id]
 
 
 def build_data_value(datatype: str, value):
@@ -105,8 +201,8 @@ def build_data_value(datatype: str, value):
         raise NotImplementedError(f"Datatype {datatype} not implemented")
 
 
-def build_snak(property_id: str, value):
-    data_type = get_property_type(property_id)
+def build_snak(property_id: str, value, repo: Optional[WikidataSession] = None):
+    data_type = get_property_type(property_id, repo)
     data_value = build_data_value(data_type, value)
 
     return {
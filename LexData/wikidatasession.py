@@ -1,20 +1,53 @@
 import logging
+import threading
 import time
-from typing import Any, Dict, Optional
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
 
+from .cache import DiskCache, MemoryCache, entity_title
+from .codec import JSONCodec, default_codec
+from .lemmaindex import LemmaIndex
+from .metrics import Metrics
+from .throttle import AdaptiveThrottle, retry_after
 from .version import user_agent
 
+if TYPE_CHECKING:
+    from .editqueue import EditQueue
+
 
 class WikidataSession:
     """Wikidata network and authentication session. Needed for everything this
     framework does.
+
+    A session can be used from many threads at the same time: every thread
+    gets its own HTTP session, they all share the cookies, the CSRF token and
+    one connection pool of at most pool_size connections. The number of
+    concurrent requests adapts to the replication lag of the servers, see
+    AdaptiveThrottle. The default throttle starts at 4 concurrent requests and
+    only rises while requests succeed, so more workers than that (for example
+    in fetch_parallel()) don't pay off at first – pass a throttle with a higher
+    initial limit to start faster. A request refused because of lag or
+    overload more than max_retries times raises an exception.
     """
 
     URL: str = "https://www.wikidata.org/w/api.php"
     assertUser: Optional[str] = None
     maxlag: int = 5
+    # Number of times a request is repeated because of maxlag or overload,
+    # before giving up
+    max_retries: int = 10
+    # Maximal number of ids the API accepts in one wbgetentities request
+    max_ids: int = 50
+    # Number of lexemes created by get_or_create_lexeme(s) that are
+    # remembered, until the search finds them
+    max_created: int = 10000
 
     def __init__(
         self,
@@ -23,15 +56,52 @@ class WikidataSession:
         token: Optional[str] = None,
         auth: Optional[str] = None,
         user_agent: str = user_agent,
+        pool_size: int = 10,
+        cache: Optional[DiskCache] = None,
+        memory_cache: Optional[MemoryCache] = None,
+        lemma_index: Optional[LemmaIndex] = None,
+        throttle: Optional[AdaptiveThrottle] = None,
+        metrics: Optional[Metrics] = None,
+        codec: Optional[JSONCodec] = None,
     ):
         """
         Create a wikidata session by login in and getting the token
+
+        :param pool_size: Maximal number of connections kept open, should be
+                          at least the number of threads using the session
+        :param cache: Persistent cache for the data of entities
+        :param memory_cache: In-process cache for the data of entities
+        :param lemma_index: Local index consulted before searching lexemes
+        :param throttle: Limit of concurrent requests, can be shared with
+                         other sessions, by default AdaptiveThrottle()
+        :param metrics: Counters of the requests sent, see Metrics
+        :param codec: Encoder and decoder of JSON, by default the fastest
+                      one available, see default_codec()
         """
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.lemma_index = lemma_index
+        self.throttle = throttle or AdaptiveThrottle()
+        self.metrics = metrics or Metrics()
+        self.codec = codec or default_codec()
         self.username = username
         self.password = password
         self.auth = auth
-        self.headers = {"User-Agent": user_agent}
-        self.S = requests.Session()
+        # Negotiate all compressions urllib3 can decode: gzip, deflate and
+        # brotli if installed
+        self.headers = {"User-Agent": user_agent, **make_headers(accept_encoding=True)}
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self._local = threading.local()
+        # Lazy lexeme handles, that are not loaded yet
+        self._refs: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()
+        self._refs_lock = threading.Lock()
+        # The latest lexemes created by get_or_create_lexeme(s) by (lemma,
+        # language, lexical category), and a lock per key held while creating
+        # one
+        self._created: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._creating: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._created_lock = threading.Lock()
         if username is not None and password is not None:
             # Since logins don't put load on the servers
             # we set maxlag higher for these requests.
@@ -46,6 +116,22 @@ class WikidataSession:
             # truncate bot name if a "bot password" is used
             self.assertUser = username.split("@")[0]
 
+    @property
+    def S(self) -> requests.Session:
+        """
+        The HTTP session of the current thread
+
+        :rtype: requests.Session
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.cookies = self.cookies
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._local.session = session
+        return session
+
     def login(self):
         # Ask for a token
         PARAMS_1 = {
@@ -90,23 +176,79 @@ class WikidataSession:
         if "assertuser" not in data and self.assertUser is not None:
             data["assertuser"] = self.assertUser
         data["maxlag"] = str(self.maxlag)
-        R = self.S.post(self.URL, data=data, headers=self.headers, auth=self.auth)
-        if R.status_code != 200:
-            raise Exception(
-                "POST was unsuccessfull ({}): {}".format(R.status_code, R.text)
+        action = data.get("action", "")
+        for retries in count():
+            R = self._send(
+                action, self.S.post, data=data, headers=self.headers, auth=self.auth
             )
-        DATA = R.json()
-        if "error" in DATA:
-            if DATA["error"]["code"] == "maxlag":
-                sleepfor = float(R.headers.get("retry-after", 5))
-                logging.info("Maxlag hit, waiting for %.1f seconds", sleepfor)
-                time.sleep(sleepfor)
-                return self.post(data)
-            else:
+            if self._overloaded(action, R, retries):
+                continue
+            if R.status_code != 200:
+                self.metrics.record_error(action, str(R.status_code))
+                raise Exception(
+                    "POST was unsuccessfull ({}): {}".format(R.status_code, R.text)
+                )
+            DATA = self.codec.loads(R.content)
+            if "error" not in DATA:
+                break
+            self.metrics.record_error(action, DATA["error"]["code"])
+            if DATA["error"]["code"] != "maxlag":
                 raise PermissionError("API returned error: " + str(DATA["error"]))
+            self._back_off(action, R, retries)
+        self.throttle.success()
         logging.debug("Post request succeed")
+        self._invalidate(data)
         return DATA
 
+    def _send(
+        self, action: str, method: Callable[..., requests.Response], **kwargs: Any
+    ) -> requests.Response:
+        # Send one request through the throttle and record its metrics
+        with self.throttle:
+            start = time.perf_counter()
+            R = method(self.URL, **kwargs)
+            latency = time.perf_counter() - start
+        body = R.request.body
+        # The length of streamed bodies isn't known
+        sent = len(R.request.url or "")
+        if isinstance(body, (bytes, str)):
+            sent += len(body)
+        # Bytes on the wire, before decompression
+        decoded = len(R.content)
+        received = R.raw.tell() if hasattr(R.raw, "tell") else decoded
+        self.metrics.record(action, latency, sent, received, decoded)
+        return R
+
+    def _overloaded(self, action: str, R: requests.Response, retries: int) -> bool:
+        # Back off if the servers refuse the request because of load
+        if R.status_code in (429, 503):
+            self.metrics.record_error(action, str(R.status_code))
+            self._back_off(action, R, retries)
+            return True
+        return False
+
+    def _back_off(self, action: str, R: requests.Response, retries: int):
+        # All requests of the session wait, also those of other threads
+        if retries >= self.max_retries:
+            raise Exception(
+                "{} failed after {} retries, the servers are overloaded ({})".format(
+                    action, retries, R.status_code
+                )
+            )
+        sleepfor = retry_after(R.headers)
+        logging.info("Maxlag hit, waiting for %.1f seconds", sleepfor)
+        self.metrics.record_retry(action, sleepfor)
+        self.throttle.backoff(sleepfor)
+
+    def _invalidate(self, data: Dict[str, str]):
+        # Remove an entity edited by a POST request from the memory cache
+        if self.memory_cache is None:
+            return
+        for key in ("id", "lexemeId", "entity", "claim"):
+            if key in data:
+                entity_id = data[key].split("$")[0].split("-")[0]
+                self.memory_cache.remove([entity_id])
+
     def get(self, data: Dict[str, str]) -> Any:
         """Send a GET request to wikidata
 
@@ -116,19 +258,207 @@ class WikidataSession:
         :rtype: Any
 
         """
-        R = self.S.get(self.URL, params=data, headers=self.headers)
-        DATA = R.json()
-        if R.status_code != 200 or "error" in DATA:
+        action = data.get("action", "")
+        for retries in count():
+            R = self._send(action, self.S.get, params=data, headers=self.headers)
+            if self._overloaded(action, R, retries):
+                continue
+            DATA = self.codec.loads(R.content)
+            if R.status_code == 200 and "error" not in DATA:
+                break
+            code = DATA.get("error", {}).get("code", str(R.status_code))
+            self.metrics.record_error(action, code)
             # We do not set maxlag for GET requests – so this error can only
             # occur if the users sets maxlag in the request data object
-            if DATA["error"]["code"] == "maxlag":
-                sleepfor = float(R.headers.get("retry-after", 5))
-                logging.info("Maxlag hit, waiting for %.1f seconds", sleepfor)
-                time.sleep(sleepfor)
-                return self.get(data)
-            else:
+            if code != "maxlag":
                 raise Exception(
                     "GET was unsuccessfull ({}): {}".format(R.status_code, R.text)
                 )
+            self._back_off(action, R, retries)
+        self.throttle.success()
         logging.debug("Get request succeed")
         return DATA
+
+    def get_entities(
+        self, ids: Iterable[str], props: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Fetch the data of many entities with as few requests as possible.
+
+        The ids are deduplicated and packed into wbgetentities requests of at
+        most max_ids entities each.
+
+        :param ids: Entity identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :param props: Only request these parts of the entities (example:
+                      ["info"]), see the API documentation of wbgetentities
+        :type  props: Optional[List[str]]
+        :returns: Entity data by requested id. Entities that don't exist (or
+                  got deleted) are returned as ``{"id": …, "missing": ""}``.
+        :rtype: Dict[str, Any]
+
+        """
+        return self._get_entities(ids, props, map)
+
+    def lexeme_ref(self, id_lex: str) -> Any:
+        """Get a lazy handle of a lexeme. Creating it costs nothing, it is
+        loaded on the first access to its data. All pending handles of the
+        session are then loaded together with batched requests.
+
+        :param id_lex: Lexeme identifier (example: "L2"). For ids of forms
+                       and senses the handle of their lexeme is returned.
+        :type  id_lex: str
+        :rtype: Lexeme
+        """
+        from .lexeme import Lexeme
+
+        ref = Lexeme.ref(self, id_lex.split("-")[0])
+        with self._refs_lock:
+            self._refs[id(ref)] = ref
+        return ref
+
+    def edit_queue(
+        self, workers: int = 4, max_rate: Optional[float] = None, max_merge: int = 50
+    ) -> "EditQueue":
+        """Create a write-behind queue of edits sent with this session. The
+        edits are queued without waiting for the API and return futures.
+
+        :param workers: Number of edits sent in parallel
+        :type  workers: int
+        :param max_rate: Maximal number of edits per second
+        :type  max_rate: Optional[float]
+        :param max_merge: Maximal number of queued operations merged into
+                          one edit
+        :type  max_merge: int
+        :rtype: EditQueue
+        """
+        from .editqueue import EditQueue
+
+        return EditQueue(self, workers=workers, max_rate=max_rate, max_merge=max_merge)
+
+    def resolve_refs(self):
+        """Load all pending lazy lexeme handles with batched requests."""
+        with self._refs_lock:
+            # Handles loaded on their own in the mean time are skipped
+            refs = [ref for ref in self._refs.values() if ref._lazy]
+            self._refs.clear()
+        if not refs:
+            return
+        entities = self.get_entities(ref.id for ref in refs)
+        for ref in refs:
+            ref._resolve(entities[ref.id])
+
+    def fetch_parallel(
+        self, ids: Iterable[str], workers: int = 4, props: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Like get_entities(), but the wbgetentities requests are sent in
+        parallel by a pool of threads.
+
+        :param ids: Entity identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :param workers: Number of requests to send in parallel, within the
+                        current limit of the throttle of the session
+        :type  workers: int
+        :param props: Only request these parts of the entities
+        :type  props: Optional[List[str]]
+        :returns: Entity data by requested id, see get_entities()
+        :rtype: Dict[str, Any]
+
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return self._get_entities(ids, props, executor.map)
+
+    def _get_entities(
+        self, ids: Iterable[str], props: Optional[List[str]], mapper: Callable
+    ) -> Dict[str, Any]:
+        ids = list(dict.fromkeys(ids))
+        # The caches hold only complete entities
+        memory_cache = self.memory_cache if props is None else None
+        cache = self.cache if props is None else None
+        entities: Dict[str, Any] = {}
+        if memory_cache is not None:
+            entities.update(memory_cache.get_many(ids))
+        if cache is not None:
+            cached = self._get_cached_entities(
+                cache, [i for i in ids if i not in entities], mapper
+            )
+            if memory_cache is not None:
+                memory_cache.put_many(cached)
+            entities.update(cached)
+        uncached = [i for i in ids if i not in entities]
+        chunks = [
+            uncached[i : i + self.max_ids]
+            for i in range(0, len(uncached), self.max_ids)
+        ]
+
+        def fetch(chunk: List[str]) -> Any:
+            PARAMS = {
+                "action": "wbgetentities",
+                "format": "json",
+                "ids": "|".join(chunk),
+            }
+            if props is not None:
+                PARAMS["props"] = "|".join(props)
+            return self.get(PARAMS)
+
+        fetched: Dict[str, Any] = {}
+        for DATA in mapper(fetch, chunks):
+            for entity_id, entity in DATA["entities"].items():
+                # Redirected entities are returned under their target id
+                redirect = entity.get("redirects")
+                if redirect is not None:
+                    fetched[redirect["from"]] = entity
+                else:
+                    fetched[entity_id] = entity
+        if cache is not None:
+            cache.put_many({i: e for i, e in fetched.items() if e.get("id") == i})
+        if memory_cache is not None:
+            memory_cache.put_many(fetched)
+        entities.update(fetched)
+        for entity_id in ids:
+            entities.setdefault(entity_id, {"id": entity_id, "missing": ""})
+        return entities
+
+    def _get_cached_entities(
+        self, cache: DiskCache, ids: List[str], mapper: Callable
+    ) -> Dict[str, Any]:
+        # Serve the entities from the cache, which are still up to date
+        cached = cache.revisions(i for i in ids if cache.cachable(i))
+        latest = self._get_revisions(list(cached), mapper) if cached else {}
+        fresh = [i for i, revid in cached.items() if latest.get(i) == revid]
+        cache.remove(i for i in cached if latest.get(i) is None)
+        cache.record(len(fresh), len(ids) - len(fresh))
+        return cache.get_many(fresh)
+
+    def get_revisions(self, ids: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Get the ids of the latest revisions of many entities with as few
+        requests as possible.
+
+        :param ids: Entity identifiers (example: ["L2", "L3"])
+        :type  ids: Iterable[str]
+        :returns: Latest revision id by entity id, None if the entity doesn't
+                  exist
+        :rtype: Dict[str, Optional[int]]
+
+        """
+        return self._get_revisions(list(dict.fromkeys(ids)), map)
+
+    def _get_revisions(
+        self, ids: List[str], mapper: Callable
+    ) -> Dict[str, Optional[int]]:
+        chunks = [ids[i : i + self.max_ids] for i in range(0, len(ids), self.max_ids)]
+
+        def fetch(chunk: List[str]) -> Any:
+            PARAMS = {
+                "action": "query",
+                "format": "json",
+                "prop": "info",
+                "titles": "|".join(entity_title(i) for i in chunk),
+            }
+            return self.get(PARAMS)
+
+        revisions: Dict[str, Optional[int]] = dict.fromkeys(ids)
+        for DATA in mapper(fetch, chunks):
+            for page in DATA["query"]["pages"].values():
+                if "missing" not in page and "redirect" not in page:
+                    revisions[page["title"].split(":")[-1]] = page["lastrevid"]
+        return revisions
@@ -0,0 +1,406 @@
+"""
+A local stand-in for the Wikibase api.php, serving lexemes from memory.
+
+It implements the subset of the API used by LexData: tokens and login,
+prop=info, wbgetentities, wbsearchentities, wbladdform, wbladdsense,
+wbcreateclaim and wbeditentity, including changes and removals of the
+claims of forms and senses. Under /sparql the lemma queries of SparqlClient
+are answered. The latency of every request and maxlag errors can be
+injected to simulate a loaded cluster.
+"""
+import copy
+import gzip
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class Store:
+    """The entities served by the fake API"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entities: Dict[str, Dict[str, Any]] = {}
+        self.next_id = 1
+        self.revision = 100
+        self.requests = 0
+
+    def _next_revision(self) -> int:
+        self.revision += 1
+        return self.revision
+
+    def add_lexeme(
+        self,
+        lemma: str,
+        lang: str,
+        lang_qid: str,
+        category: str,
+        forms: Iterable[str] = (),
+        senses: Iterable[str] = (),
+    ) -> str:
+        """
+        Add a lexeme with forms and senses
+
+        :param lemma: The lemma
+        :param lang: Language code of the lemma and forms
+        :param lang_qid: QID of the language of the lexeme
+        :param category: QID of the lexical category
+        :param forms: Representations of the forms
+        :param senses: English glosses of the senses
+        :returns: The id of the lexeme
+        """
+        lexeme_id = "L%d" % self.next_id
+        self.next_id += 1
+        lexeme = {
+            "type": "lexeme",
+            "id": lexeme_id,
+            "lastrevid": self._next_revision(),
+            "ns": 146,
+            "title": "Lexeme:" + lexeme_id,
+            "lemmas": {lang: {"language": lang, "value": lemma}},
+            "language": lang_qid,
+            "lexicalCategory": category,
+            "claims": {},
+            "forms": [],
+            "senses": [],
+            "nextFormId": 1,
+            "nextSenseId": 1,
+        }
+        for form in forms:
+            representation = {lang: {"language": lang, "value": form}}
+            self._add_form(lexeme, {"representations": representation})
+        for gloss in senses:
+            glosses = {"en": {"language": "en", "value": gloss}}
+            self._add_sense(lexeme, {"glosses": glosses})
+        self.entities[lexeme_id] = lexeme
+        return lexeme_id
+
+    def _add_form(self, lexeme: Dict, data: Dict) -> Dict:
+        form = {
+            "id": "%s-F%d" % (lexeme["id"], lexeme["nextFormId"]),
+            "representations": data.get("representations", {}),
+            "grammaticalFeatures": data.get("grammaticalFeatures", []),
+            "claims": self._claims(data.get("claims", [])),
+        }
+        lexeme["nextFormId"] += 1
+        lexeme["forms"].append(form)
+        return form
+
+    def _add_sense(self, lexeme: Dict, data: Dict) -> Dict:
+        sense = {
+            "id": "%s-S%d" % (lexeme["id"], lexeme["nextSenseId"]),
+            "glosses": data.get("glosses", {}),
+            "claims": self._claims(data.get("claims", [])),
+        }
+        lexeme["nextSenseId"] += 1
+        lexeme["senses"].append(sense)
+        return sense
+
+    def _claim(self, claim: Dict) -> Dict:
+        claim = copy.deepcopy(claim)
+        claim.setdefault("id", "X$%d" % self._next_revision())
+        claim.setdefault("type", "statement")
+        claim.setdefault("rank", "normal")
+        return claim
+
+    def _claims(self, claims: Any) -> Dict[str, list]:
+        if isinstance(claims, dict):
+            claims = [claim for values in claims.values() for claim in values]
+        result: Dict[str, list] = {}
+        for claim in claims:
+            claim = self._claim(claim)
+            result.setdefault(claim["mainsnak"]["property"], []).append(claim)
+        return result
+
+    def find(self, entity_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Find a lexeme, form or sense
+
+        :returns: The lexeme and the entity itself
+        """
+        lexeme = self.entities.get(entity_id.split("-")[0])
+        if lexeme is None or lexeme["id"] == entity_id:
+            return lexeme, lexeme
+        for part in lexeme["forms"] + lexeme["senses"]:
+            if part["id"] == entity_id:
+                return lexeme, part
+        return lexeme, None
+
+
+def api(store: Store, q: Dict[str, str]) -> Dict[str, Any]:
+    """Answer an API request"""
+    action = q.get("action")
+    if action == "query" and q.get("meta") == "tokens":
+        return {"query": {"tokens": {"logintoken": "L+\\", "csrftoken": "C+\\"}}}
+    if action == "login":
+        return {"login": {"result": "Success"}}
+    if action == "query" and q.get("prop") == "info":
+        pages = {}
+        for i, title in enumerate(q["titles"].split("|")):
+            lexeme = store.entities.get(title.split(":")[-1])
+            if lexeme is None:
+                pages[str(-1 - i)] = {"ns": 146, "title": title, "missing": ""}
+            else:
+                pages[str(i + 1)] = {
+                    "pageid": i + 1,
+                    "ns": 146,
+                    "title": title,
+                    "lastrevid": lexeme["lastrevid"],
+                }
+        return {"query": {"pages": pages}}
+    if action == "wbgetentities":
+        entities = {}
+        for entity_id in q["ids"].split("|"):
+            _, entity = store.find(entity_id)
+            if entity is None:
+                entities[entity_id] = {"id": entity_id, "missing": ""}
+            else:
+                entities[entity_id] = copy.deepcopy(entity)
+        return {"entities": entities, "success": 1}
+    if action == "wbsearchentities":
+        hits = []
+        for lexeme in store.entities.values():
+            for lemma in lexeme["lemmas"].values():
+                if lemma["value"] == q["search"]:
+                    match = {
+                        "type": "label",
+                        "language": lemma["language"],
+                        "text": lemma["value"],
+                    }
+                    hits.append(
+                        {"id": lexeme["id"], "label": lemma["value"], "match": match}
+                    )
+        return {"search": hits[: int(q.get("limit", 10))], "success": 1}
+    if action in ("wbladdform", "wbladdsense"):
+        lexeme = store.entities[q["lexemeId"]]
+        if action == "wbladdform":
+            key, part = "form", store._add_form(lexeme, json.loads(q["data"]))
+        else:
+            key, part = "sense", store._add_sense(lexeme, json.loads(q["data"]))
+        lexeme["lastrevid"] = store._next_revision()
+        return {key: copy.deepcopy(part), "lastrevid": lexeme["lastrevid"], "success": 1}
+    if action == "wbcreateclaim":
+        lexeme, entity = store.find(q["entity"])
+        claim = store._claim(
+            {
+                "mainsnak": {
+                    "snaktype": "value",
+                    "property": q["property"],
+                    "datavalue": {
+                        "value": json.loads(q["value"]),
+                        "type": "wikibase-entityid",
+                    },
+                    "datatype": "wikibase-item",
+                }
+            }
+        )
+        entity["claims"].setdefault(q["property"], []).append(claim)
+        lexeme["lastrevid"] = store._next_revision()
+        return {
+            "claim": claim,
+            "pageinfo": {"lastrevid": lexeme["lastrevid"]},
+            "success": 1,
+        }
+    if action == "wbeditentity":
+        return edit_entity(store, q)
+    return {"error": {"code": "badaction", "info": str(action)}}
+
+
+def edit_entity(store: Store, q: Dict[str, str]) -> Dict[str, Any]:
+    """Answer a wbeditentity request"""
+    data = json.loads(q["data"])
+    for key in ("forms", "senses"):
+        for part in data.get(key, []):
+            if "id" not in part and "add" not in part:
+                # Like WikibaseLexeme, new parts need the "add" marker
+                info = "New {} have to be marked with add".format(key)
+                return {"error": {"code": "modification-failed", "info": info}}
+    if "new" in q:
+        lemma = next(iter(data["lemmas"].values()))
+        lexeme_id = store.add_lexeme(
+            lemma["value"], lemma["language"], data["language"], data["lexicalCategory"]
+        )
+        lexeme = entity = store.entities[lexeme_id]
+    else:
+        lexeme, entity = store.find(q["id"])
+        if lexeme is None or entity is None:
+            return {"error": {"code": "no-such-entity", "info": q["id"]}}
+        if "baserevid" in q and int(q["baserevid"]) != lexeme["lastrevid"]:
+            return {"error": {"code": "editconflict", "info": "Edit conflict"}}
+    if q.get("clear"):
+        entity["claims"] = {}
+    _edit_terms(entity, data)
+    if entity is lexeme:
+        for key in ("language", "lexicalCategory"):
+            if key in data:
+                lexeme[key] = data[key]
+    _edit_claims(store, entity, data.get("claims", []))
+    for key, add in (("forms", store._add_form), ("senses", store._add_sense)):
+        for part in data.get(key, []):
+            if "remove" in part:
+                lexeme[key] = [p for p in lexeme[key] if p["id"] != part["id"]]
+            elif "add" in part:
+                add(lexeme, part)
+            else:
+                for existing in lexeme[key]:
+                    if existing["id"] == part["id"]:
+                        _edit_terms(existing, part)
+                        if "grammaticalFeatures" in part:
+                            existing["grammaticalFeatures"] = part["grammaticalFeatures"]
+                        _edit_claims(store, existing, part.get("claims", []))
+    lexeme["lastrevid"] = store._next_revision()
+    # Like Wikibase, also the answers for forms and senses carry the revision
+    answer = dict(copy.deepcopy(entity), lastrevid=lexeme["lastrevid"])
+    return {"entity": answer, "success": 1}
+
+
+def _edit_terms(entity: Dict, data: Dict):
+    # Change or remove lemmas, representations and glosses
+    for key in ("lemmas", "representations", "glosses"):
+        for lang, value in data.get(key, {}).items():
+            if "remove" in value:
+                entity[key].pop(lang, None)
+            else:
+                entity[key][lang] = {"language": value["language"], "value": value["value"]}
+
+
+def _edit_claims(store: Store, entity: Dict, claims: Any):
+    # Add, change or remove claims of a lexeme, form or sense
+    if isinstance(claims, dict):
+        claims = [claim for values in claims.values() for claim in values]
+    if not isinstance(entity.get("claims"), dict):
+        entity["claims"] = {}
+    for claim in claims:
+        if "remove" in claim:
+            entity["claims"] = {
+                prop: kept
+                for prop, values in entity["claims"].items()
+                for kept in [[c for c in values if c["id"] != claim["id"]]]
+                if kept
+            }
+        elif "id" in claim:
+            prop = claim["mainsnak"]["property"]
+            entity["claims"][prop] = [
+                claim if c["id"] == claim["id"] else c
+                for c in entity["claims"].get(prop, [])
+            ]
+        else:
+            claim = store._claim(claim)
+            entity["claims"].setdefault(claim["mainsnak"]["property"], []).append(claim)
+
+
+# A row of the VALUES block of the lemma query of SparqlClient
+_values_row = re.compile(r'\(("(?:[^"\\]|\\.)*")@(\S+) wd:(Q\d+) wd:(Q\d+)\)')
+
+
+def sparql(store: Store, query: str) -> Dict[str, Any]:
+    """Answer the lemma query of SparqlClient"""
+    keys = {
+        (json.loads(lemma), lang, lang_qid, category)
+        for lemma, lang, lang_qid, category in _values_row.findall(query)
+    }
+    entity = "http://www.wikidata.org/entity/"
+    bindings = []
+    for lexeme in store.entities.values():
+        for lemma in lexeme["lemmas"].values():
+            key = (lemma["value"], lemma["language"], lexeme["language"])
+            if key + (lexeme["lexicalCategory"],) in keys:
+                bindings.append(
+                    {
+                        "lemma": {
+                            "type": "literal",
+                            "value": lemma["value"],
+                            "xml:lang": lemma["language"],
+                        },
+                        "language": {"type": "uri", "value": entity + key[2]},
+                        "category": {
+                            "type": "uri",
+                            "value": entity + lexeme["lexicalCategory"],
+                        },
+                        "lexeme": {"type": "uri", "value": entity + lexeme["id"]},
+                    }
+                )
+    return {"results": {"bindings": bindings}}
+
+
+def make_handler(store: Store, latency: float = 0.0, maxlag_every: int = 0):
+    """
+    Create the request handler class
+
+    :param latency: Seconds to wait before answering a request
+    :param maxlag_every: Answer every n-th request with maxlag set with a
+                         maxlag error, 0 to never do that
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, answer: Dict, headers: Optional[Dict[str, str]] = None):
+            body = json.dumps(answer).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            # Compress like the Wikimedia servers do
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=6)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            query = urllib.parse.urlparse(self.path).query
+            self._answer(dict(urllib.parse.parse_qsl(query)))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            q = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+            if self.path.startswith("/sparql"):
+                with store.lock:
+                    store.requests += 1
+                    return self._send(sparql(store, q["query"]))
+            self._answer(q)
+
+        def _answer(self, q: Dict[str, str]):
+            if latency:
+                time.sleep(latency)
+            with store.lock:
+                store.requests += 1
+                if maxlag_every and "maxlag" in q and store.requests % maxlag_every == 0:
+                    error = {"code": "maxlag", "info": "Waiting for a database server"}
+                    return self._send({"error": error}, {"Retry-After": "0"})
+                return self._send(api(store, q))
+
+    return Handler
+
+
+def serve(
+    store: Optional[Store] = None, latency: float = 0.0, maxlag_every: int = 0
+) -> Tuple[ThreadingHTTPServer, Store, str]:
+    """
+    Start the fake API in a background thread
+
+    :param store: The entities to serve, by default an empty store
+    :param latency: Seconds to wait before answering a request
+    :param maxlag_every: Answer every n-th request with maxlag set with a
+                         maxlag error
+    :returns: The server, the store and the URL of the API
+    """
+    store = store or Store()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(store, latency, maxlag_every)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d/w/api.php" % server.server_address[1]
+    return server, store, url
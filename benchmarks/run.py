@@ -0,0 +1,231 @@
+"""
+Benchmarks of LexData against a local fake api.php (see fakeapi.py), so the
+results only depend on LexData and the configured latency.
+
+Usage::
+
+    python -m benchmarks.run --lexemes 1000 --latency 0.02 --output results.json
+
+The results are written as JSON, one entry per benchmark with the number of
+items processed, the time taken and the items per second. Compare the files
+of two releases to find regressions.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import LexData
+from LexData.language import Language
+from LexData.version import version
+
+from .fakeapi import Store, serve
+
+lang_en = Language("en", "Q1860")
+noun = "Q1084"
+
+Benchmark = Callable[[LexData.WikidataSession, List[str], argparse.Namespace], int]
+benchmarks: Dict[str, Benchmark] = {}
+
+
+def benchmark(function: Benchmark) -> Benchmark:
+    benchmarks[function.__name__] = function
+    return function
+
+
+def populate(store: Store, count: int) -> List[str]:
+    """Add lexemes with a few forms and senses to the store"""
+    return [
+        store.add_lexeme(
+            "lemma%d" % i,
+            "en",
+            lang_en.qid,
+            noun,
+            forms=["form%d-%d" % (i, j) for j in range(4)],
+            senses=["gloss%d-%d" % (i, j) for j in range(2)],
+        )
+        for i in range(count)
+    ]
+
+
+@benchmark
+def fetch(repo, ids, args):
+    LexData.Lexeme.get_many(repo, ids)
+    return len(ids)
+
+
+@benchmark
+def fetch_parallel(repo, ids, args):
+    LexData.Lexeme.get_many(repo, ids, workers=args.workers)
+    return len(ids)
+
+
+@benchmark
+def search(repo, ids, args):
+    count = min(len(ids), args.operations)
+    for i in range(count):
+        LexData.search_lexemes(repo, "lemma%d" % i, lang_en, noun)
+    return count
+
+
+@benchmark
+def get_or_create(repo, ids, args):
+    # Half of the lemmas exist, the other half is created
+    count = min(len(ids), args.operations)
+    for i in range(count):
+        lemma = "lemma%d" % i if i % 2 else "new%d" % i
+        LexData.get_or_create_lexeme(repo, lemma, lang_en, noun)
+    return count
+
+
+@benchmark
+def get_or_create_many(repo, ids, args):
+    count = min(len(ids), args.operations)
+    entries = [
+        ("lemma%d" % i if i % 2 else "new%d" % i, lang_en, noun) for i in range(count)
+    ]
+    LexData.get_or_create_lexemes(repo, entries, workers=args.workers)
+    return count
+
+
+@benchmark
+def get_or_create_sparql(repo, ids, args):
+    count = min(len(ids), args.operations)
+    entries = [
+        ("lemma%d" % i if i % 2 else "sparql%d" % i, lang_en, noun)
+        for i in range(count)
+    ]
+    sparql = LexData.SparqlClient(
+        repo.URL.replace("/w/api.php", "/sparql"), workers=args.workers
+    )
+    LexData.get_or_create_lexemes(repo, entries, workers=args.workers, sparql=sparql)
+    return count
+
+
+@benchmark
+def create_form(repo, ids, args):
+    lexeme = LexData.Lexeme(repo, ids[0])
+    for i in range(args.operations):
+        lexeme.create_form("created%d" % i, ["Q110786"])
+    return args.operations
+
+
+@benchmark
+def create_sense(repo, ids, args):
+    lexeme = LexData.Lexeme(repo, ids[0])
+    for i in range(args.operations):
+        lexeme.create_sense({"en": "created %d" % i})
+    return args.operations
+
+
+@benchmark
+def edit_queue(repo, ids, args):
+    # The same edits as create_form and create_sense, through the queue
+    lexemes = LexData.Lexeme.get_many(repo, ids[: args.workers])
+    with repo.edit_queue(workers=args.workers) as edits:
+        for i in range(args.operations):
+            lexeme = lexemes[i % len(lexemes)]
+            edits.create_form(lexeme, "queued%d" % i, ["Q110786"])
+            edits.create_sense(lexeme, {"en": "queued %d" % i})
+    return args.operations * 2
+
+
+@benchmark
+def build_claims(repo, ids, args):
+    # Offline, the property types come from the bundled snapshot
+    for i in range(args.operations):
+        LexData.build_claims(
+            [
+                LexData.Claim(property_id="P5137", value="Q%d" % (i + 1)),
+                LexData.Claim(property_id="P856", value="http://example.com/"),
+            ]
+        )
+        LexData.build_claims({"P5137": ["Q1", "Q2"]})
+    return args.operations * 4
+
+
+@benchmark
+def memory(repo, ids, args):
+    # Bytes allocated per loaded lexeme, reported instead of a rate
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    lexemes = LexData.Lexeme.get_many(repo, ids)
+    # Include the Form and Sense objects
+    views = [(lexeme.forms, lexeme.senses) for lexeme in lexemes]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del views
+    return (after - before) // len(lexemes)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server, store, url = serve(latency=args.latency, maxlag_every=args.maxlag_every)
+    ids = populate(store, args.lexemes)
+    results = {}
+    try:
+        for name in args.benchmarks or benchmarks:
+            repo = LexData.WikidataSession(token="+\\", pool_size=args.workers)
+            repo.URL = url
+            start = time.perf_counter()
+            items = benchmarks[name](repo, ids, args)
+            seconds = time.perf_counter() - start
+            snapshot = repo.metrics.snapshot().values()
+            if name == "memory":
+                results[name] = {"lexemes": len(ids), "bytes_per_lexeme": items}
+            else:
+                results[name] = {
+                    "items": items,
+                    "seconds": seconds,
+                    "per_second": items / seconds,
+                    "requests": sum(action["count"] for action in snapshot),
+                    "bytes_received": sum(
+                        action["bytes_received"] for action in snapshot
+                    ),
+                    "bytes_decoded": sum(
+                        action["bytes_decoded"] for action in snapshot
+                    ),
+                }
+    finally:
+        server.shutdown()
+    return {
+        "lexdata": version,
+        "python": platform.python_version(),
+        "config": {
+            "lexemes": args.lexemes,
+            "operations": args.operations,
+            "latency": args.latency,
+            "maxlag_every": args.maxlag_every,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "benchmarks", nargs="*", help="Benchmarks to run: " + ", ".join(benchmarks)
+    )
+    parser.add_argument("--lexemes", type=int, default=500)
+    parser.add_argument("--operations", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--maxlag-every", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="File to write the results to")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(benchmarks)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results + "\n")
+    else:
+        sys.stdout.write(results + "\n")
+
+
+if __name__ == "__main__":
+    main()
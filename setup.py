@@ -12,7 +12,8 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/DiFronzo/LexData",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks"]),
+    package_data={"LexData": ["property_types.json"]},
     classifiers=[
         "Programming Language :: Python :: 3 :: Only",
         "Programming Language :: Python :: 3.7",
@@ -24,4 +25,8 @@ setuptools.setup(
     install_requires=[
         "requests>=2.27.0",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.8.0"],
+        "fast": ["orjson>=3.6.0", "brotli>=1.0.9"],
+    },
 )
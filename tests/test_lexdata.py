@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
-from datetime import datetime
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
 from pathlib import Path
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
 import LexData
+from LexData.dump import DumpReader, DumpSession
+from benchmarks import fakeapi
 
 
 @pytest.fixture
@@ -42,6 +48,17 @@ def repoWikidata():
     return test
 
 
+@pytest.fixture
+def fake():
+    # A session of a local fake API, for tests without network
+    server, store, url = fakeapi.serve()
+    repo = LexData.WikidataSession()
+    repo.URL = url
+    repo.CSRF_TOKEN = "+\\"
+    yield repo, store
+    server.shutdown()
+
+
 def test_auth(credentials):
     with pytest.raises(Exception):
         assert LexData.WikidataSession("Username", "Password")
@@ -72,6 +89,114 @@ def test_lexeme(repo):
     assert example.value["language"] == "en"
 
 
+def test_get_many(repo):
+    lexemes = LexData.Lexeme.get_many(repo, ["L3302", "L2", "L999999999"])
+    assert [lex.id for lex in lexemes[:2]] == ["L3302", "L2"]
+    assert lexemes[1].lemma == "first"
+    assert lexemes[2] is None
+
+
+def test_selective_loading(repo):
+    L2 = LexData.Lexeme(repo, "L2", props=["lemmas"], languages=["en"])
+    assert L2.partial
+    assert list(L2["lemmas"]) == ["en"]
+    assert "senses" not in L2
+    assert len(L2.senses) > 0
+    assert all(set(sense["glosses"]) <= {"en"} for sense in L2.senses)
+    L2.load()
+    assert not L2.partial
+    lexemes = LexData.Lexeme.get_many(repo, ["L2", "L3302"], props=["claims"])
+    assert all(lex.partial and "forms" not in lex for lex in lexemes)
+
+
+def test_fetch_parallel(repo):
+    entities = repo.fetch_parallel(["L2", "L3302", "L999999999"], workers=2)
+    assert entities["L2"]["id"] == "L2"
+    assert "missing" in entities["L999999999"]
+    lexemes = LexData.Lexeme.get_many(repo, ["L2", "L3302"], workers=2)
+    assert [lex.id for lex in lexemes] == ["L2", "L3302"]
+
+
+def test_lexeme_ref(repo):
+    L2 = repo.lexeme_ref("L2")
+    L3302 = repo.lexeme_ref("L3302-S1")
+    assert L2.partial and L3302.partial
+    assert L2.id == "L2"
+    assert L2.lemma == "first"
+    assert not L3302.partial
+    assert L3302.lemma == "water"
+
+
+def test_disk_cache(tmp_path):
+    cache = LexData.DiskCache(str(tmp_path / "cache.sqlite"), max_entries=1)
+    repo = LexData.WikidataSession(cache=cache)
+    LexData.Lexeme(repo, "L2")
+    assert cache.stats == {"hits": 0, "misses": 1, "entries": 1}
+    L2 = LexData.Lexeme(repo, "L2")
+    assert L2.lemma == "first"
+    assert cache.stats == {"hits": 1, "misses": 1, "entries": 1}
+    LexData.Lexeme(repo, "L3302")
+    assert len(cache) == 1
+
+
+def test_memory_cache(repoTestWikidata):
+    cache = LexData.MemoryCache(max_entries=10, ttl=60)
+    repoTestWikidata.memory_cache = cache
+    L123 = LexData.Lexeme(repoTestWikidata, "L123")
+    L123["lemmas"].clear()
+    assert LexData.Lexeme(repoTestWikidata, "L123")["lemmas"]
+    assert cache.stats["hits"] == 1
+    L123.create_sense({"en": "cache test"})
+    assert len(cache) == 0
+
+
+def test_throttle(repo):
+    throttle = repo.throttle
+    limit = throttle.limit
+    throttle.backoff(0.1)
+    assert throttle.limit == max(throttle.minimum, limit / 2)
+    with throttle:
+        assert throttle.active == 1
+    throttle.success()
+    assert throttle.limit > max(throttle.minimum, limit / 2)
+    assert LexData.Lexeme(repo, "L2")
+
+
+def test_metrics(repo):
+    repo.metrics.reset()
+    LexData.Lexeme(repo, "L2")
+    snapshot = repo.metrics.snapshot()["wbgetentities"]
+    assert snapshot["count"] == 1
+    assert snapshot["bytes_received"] > 0
+    # The answer is compressed on the wire
+    assert snapshot["bytes_decoded"] > snapshot["bytes_received"]
+    assert snapshot["latency_buckets"][float("inf")] == 1
+    assert 'lexdata_requests_total{action="wbgetentities"} 1' in (
+        repo.metrics.to_prometheus()
+    )
+
+
+def test_codec():
+    data = {"lemmas": {"en": {"language": "en", "value": "wåter"}}, "id": 2 ** 70}
+    for codec in (LexData.JSONCodec(), LexData.default_codec()):
+        assert codec.loads(codec.dumps(data)) == data
+        assert codec.loads(codec.dumps(data).encode()) == data
+
+
+def test_async_session():
+    async def load():
+        async with LexData.AsyncWikidataSession() as repo:
+            lexemes = await repo.get_lexemes(["L2", "L3302"])
+            ids = await repo.search_lexeme_ids(
+                "water", LexData.language.lang_en, "Q1084"
+            )
+            return lexemes, ids
+
+    lexemes, ids = asyncio.run(load())
+    assert lexemes[0].lemma == "first"
+    assert ids == ["L3302"]
+
+
 def test_sense(repo):
     L2 = LexData.Lexeme(repo, "L2")
     assert str(L2)
@@ -100,17 +225,97 @@ def test_form(repo):
         assert isinstance(form.claims, dict)
 
 
+def test_views(repo):
+    L2 = LexData.Lexeme(repo, "L2")
+    assert L2.forms[0] is L2.forms[0]
+    assert L2.forms[0] is L2["forms"][0]
+    assert L2.senses[0].claims is L2.senses[0].claims
+    assert L2.claims["P5831"][0] is L2["claims"]["P5831"][0]
+
+
 def test_writes(repoTestWikidata):
     L123 = LexData.Lexeme(repoTestWikidata, "L123")
 
     L123.create_claims({"P7": ["Q100"]})
-    L123.add_claims({"P7": ["Q100"]})
+    count = len(L123.claims.get("P7", []))
+    L123.add_claims({"P7": ["Q100", "Q100"]})
+    assert len(L123.claims["P7"]) == count + 2
+    assert L123.changes() == {}
 
-    L123.create_form("test", ["Q100"])
+    form_id = L123.create_form("test", ["Q100"])
+    form = [form for form in L123.forms if form.id == form_id][0]
+    form.add_claims({"P7": ["Q100"], "P8": ["Q100"]})
+    assert set(form.claims) == {"P7", "P8"}
 
     L123.create_sense({"de": "testtest", "en": "testtest"})
     L123.create_sense({"de": "more tests", "en": "more tests"}, claims={})
+    revision = L123["lastrevid"]
     L123.create_sense({"en": "even more tests"}, claims={"P7": ["Q100"]})
+    assert L123["lastrevid"] > revision
+    assert L123.changes() == {}
+
+
+def test_edit_queue(repoTestWikidata):
+    L123 = LexData.Lexeme(repoTestWikidata, "L123")
+    with repoTestWikidata.edit_queue(workers=2) as edits:
+        forms = [edits.create_form(L123, "queued", ["Q100"]) for _ in range(3)]
+        sense = edits.create_sense(L123, {"en": "queued"}, claims={"P7": ["Q100"]})
+        claims = edits.add_claims(L123, {"P7": ["Q100"]})
+        missing = LexData.Lexeme.ref(repoTestWikidata, "L999999999")
+        missing = edits.add_claims(missing, {"P7": ["Q100"]})
+    form_ids = [future.result() for future in forms]
+    assert len(set(form_ids)) == 3
+    assert all(form_id in [form.id for form in L123.forms] for form_id in form_ids)
+    assert sense.result() in [sense.id for sense in L123.senses]
+    assert claims.result() is None
+    assert isinstance(missing.exception(), LexData.EditError)
+
+    # Edits of only a form still move the revision of the lexeme
+    revision = L123["lastrevid"]
+    with repoTestWikidata.edit_queue() as edits:
+        edits.add_claims(L123.forms[0], {"P7": ["Q100"]})
+    assert L123["lastrevid"] > revision
+    assert L123.changes() == {}
+
+
+def test_update_from_json(repoTestWikidata):
+    L123 = LexData.Lexeme(repoTestWikidata, "L123")
+    revision = L123["lastrevid"]
+    L123.update_from_json('{"lemmas": {"en": {"language": "en", "value": "test"}}}')
+    assert L123.lemma == "test"
+    assert L123["lastrevid"] > revision
+    assert isinstance(L123.forms, list)
+
+
+def test_save(repoTestWikidata):
+    lexeme = LexData.create_lexeme(
+        repoTestWikidata,
+        "foobar",
+        LexData.language.lang_en,
+        "Q100",
+        forms=[{"form": "foobars", "infos_gram": ["Q100"]}],
+    )
+    assert lexeme.changes() == {}
+    assert not lexeme.save()
+    lexeme["lemmas"]["en"]["value"] = "foobaz"
+    lexeme.forms[0]["representations"]["en"]["value"] = "foobazs"
+    lexeme["senses"].append({"glosses": {"en": {"language": "en", "value": "test"}}})
+    changes = lexeme.changes()
+    assert set(changes) == {"lemmas", "forms", "senses"}
+    assert lexeme.save()
+    assert lexeme.changes() == {}
+    lexeme = LexData.Lexeme(repoTestWikidata, lexeme.id)
+    assert lexeme.lemma == "foobaz"
+    assert lexeme.forms[0].form == "foobazs"
+    assert len(lexeme.senses) == 1
+
+    # Edits of forms and senses move the revision of their lexeme
+    revision = lexeme["lastrevid"]
+    lexeme.forms[0].add_claims({"P7": ["Q100"]})
+    assert lexeme["lastrevid"] > revision
+    assert lexeme.changes() == {}
+    lexeme["lemmas"]["en"]["value"] = "foobar"
+    assert lexeme.save()
 
 
 def test_search(repo):
@@ -118,9 +323,31 @@ def test_search(repo):
     assert len(results) == 1
     assert results[0].get("id") == "L3302"
 
+    ids = LexData.search_lexeme_ids(repo, "water", LexData.language.lang_en, "Q1084")
+    assert ids == ["L3302"]
+
     result = LexData.get_or_create_lexeme(repo, "water", LexData.language.lang_en, "Q1084")
     assert result["id"] == "L3302"
 
+    en = LexData.language.lang_en
+    results = LexData.get_or_create_lexemes(
+        repo, [("water", en, "Q1084"), ("water", en, "Q1084")]
+    )
+    assert results == {
+        ("water", en.qid, "Q1084"): LexData.LexemeResult("found", ["L3302"])
+    }
+
+
+def test_sparql():
+    en = LexData.language.lang_en
+    sparql = LexData.SparqlClient(chunk_size=1)
+    ids = sparql.resolve_lexemes(
+        [("water", en, "Q1084"), ("first", en, "Q34698"), ("xyzzy-no-lexeme", en, "Q1084")]
+    )
+    assert ids[("water", en.qid, "Q1084")] == ["L3302"]
+    assert "L2" in ids[("first", en.qid, "Q34698")]
+    assert ids[("xyzzy-no-lexeme", en.qid, "Q1084")] == []
+
 
 def test_detatchedClaim(repo):
     LexData.Claim(property_id="P369", value="Q1")
@@ -139,5 +366,302 @@ def test_detatchedClaim(repo):
         LexData.Claim(property_id="P0", value="foo")
 
 
+def test_build_claims():
+    snak = {
+        "snaktype": "value",
+        "property": "P1684",
+        "datavalue": {
+            "value": {"text": "foo", "language": "en"},
+            "type": "monolingualtext",
+        },
+        "datatype": "monolingualtext",
+    }
+    claim = LexData.Claim({"mainsnak": snak, "rank": "normal"})
+    # Claim objects are sent as whole statements including their value
+    (statement,) = LexData.build_claims([claim])
+    assert statement == {"mainsnak": snak, "rank": "normal", "type": "statement"}
+    assert statement["mainsnak"]["datavalue"]["value"] == claim.value
+    (statement,) = LexData.build_claims({"P7": ["Q100"]})
+    assert statement["mainsnak"]["datavalue"]["value"] == {
+        "entity-type": "item",
+        "id": "Q100",
+    }
+
+
+def test_property_types(repo, tmp_path):
+    LexData.utils.use_property_type_cache(str(tmp_path / "types.sqlite"))
+    types = LexData.utils.get_property_types(["P31", "P5831", "P1684"], repo)
+    assert types == {
+        "P31": "wikibase-item",
+        "P5831": "monolingualtext",
+        "P1684": "monolingualtext",
+    }
+    claim = LexData.Claim(property_id="P5137", value="Q1", repo=repo)
+    assert claim.type == "wikibase-item"
+
+    # Datatypes unknown to the process are read from the database
+    LexData.utils._property_types.pop(repo.URL)
+    repo.metrics.reset()
+    assert LexData.utils.get_property_types(["P1684"], repo) == {
+        "P1684": "monolingualtext"
+    }
+    assert "wbgetentities" not in repo.metrics.snapshot()
+
+
+@pytest.fixture
+def dump(tmp_path):
+    lexemes = [
+        {
+            "type": "lexeme",
+            "id": "L{}".format(i),
+            "lemmas": {"en": {"language": "en", "value": "lemma{}".format(i)}},
+            "language": "Q1860" if i % 2 else "Q188",
+            "lexicalCategory": "Q1084",
+            "forms": [{"id": "L{}-F1".format(i), "representations": {}}],
+            "senses": [],
+        }
+        for i in range(1, 11)
+    ]
+    path = tmp_path / "lexemes.json.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("[\n" + ",\n".join(json.dumps(lex) for lex in lexemes) + "\n]\n")
+    return str(path)
+
+
+def test_dump(dump):
+    reader = DumpReader(dump, languages=[LexData.language.lang_en])
+    lexemes = list(reader)
+    assert [lex.id for lex in lexemes] == ["L1", "L3", "L5", "L7", "L9"]
+    assert lexemes[0].lemma == "lemma1"
+    assert reader.stats["read"] == 10
+    assert reader.stats["matched"] == 5
+    assert len(list(DumpReader(dump).forms())) == 10
+
+
+def test_dump_session(dump, tmp_path):
+    path = str(tmp_path / "lexemes.json")
+    with gzip.open(dump, "rb") as compressed, open(path, "wb") as f:
+        f.write(compressed.read())
+    repo = DumpSession(path)
+    L3 = LexData.Lexeme(repo, "L3")
+    assert L3.lemma == "lemma3"
+    assert L3.forms[0].id == "L3-F1"
+    lexemes = LexData.Lexeme.get_many(repo, ["L10", "L11"])
+    assert lexemes[0].id == "L10"
+    assert lexemes[1] is None
+    with pytest.raises(PermissionError):
+        L3.create_sense({"en": "test"})
+    repo.close()
+
+
+def test_lemma_index(dump, tmp_path):
+    index = LexData.LemmaIndex(str(tmp_path / "lemmas.sqlite"))
+    index.build_from_dump(dump)
+    assert len(index) == 10
+    assert index.lookup("lemma2", LexData.language.lang_de, "Q1084") == ["L2"]
+    assert index.lookup("lemma2", LexData.language.lang_en, "Q1084") == []
+
+    repo = LexData.WikidataSession(lemma_index=index)
+    results = LexData.search_lexeme_ids(repo, "water", LexData.language.lang_en, "Q1084")
+    assert results == ["L3302"]
+    assert index.lookup("water", LexData.language.lang_en, "Q1084") == ["L3302"]
+
+
+def test_mirror(dump, tmp_path):
+    repo = LexData.WikidataSession()
+    mirror = LexData.LexemeMirror(
+        repo, str(tmp_path / "mirror.sqlite"), languages=[LexData.language.lang_en]
+    )
+    mirror.build_from_dump(dump)
+    assert len(mirror) == 5
+    assert mirror.get("L3").lemma == "lemma3"
+    assert "L2" not in mirror
+
+    mirror.checkpoint = (datetime.utcnow() - timedelta(minutes=10)).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    stats = mirror.sync()
+    assert set(stats) == {"changes", "updated", "removed"}
+    assert mirror.checkpoint >= "2020"
+
+
 def test_createLexeme(repoTestWikidata):
     LexData.create_lexeme(repoTestWikidata, "foobar", LexData.language.lang_en, "Q100")
+    lexeme = LexData.create_lexeme(
+        repoTestWikidata,
+        "foobar",
+        LexData.language.lang_en,
+        "Q100",
+        claims={"P7": ["Q100"]},
+        forms=[{"form": "foobars", "infos_gram": ["Q100"], "claims": {"P7": ["Q100"]}}],
+        senses=[{"glosses": {"en": "test"}}],
+    )
+    assert lexeme.lemma == "foobar"
+    assert [form.form for form in lexeme.forms] == ["foobars"]
+    assert len(lexeme.senses) == 1
+    assert "P7" in lexeme.claims
+
+
+def test_get_or_create_lexemes(repoTestWikidata):
+    en = LexData.language.lang_en
+    lemma = "foobar-{}".format(datetime.now().timestamp())
+    entries = [(lemma, en, "Q100")] * 3
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        runs = list(
+            executor.map(
+                lambda _: LexData.get_or_create_lexemes(repoTestWikidata, entries),
+                range(2),
+            )
+        )
+    first, second = (run[(lemma, en.qid, "Q100")] for run in runs)
+    assert first.ids == second.ids
+    assert sorted([first.status, second.status]) == ["created", "found"]
+
+
+def test_stale_part_claims(fake):
+    repo, store = fake
+    lexeme_id = store.add_lexeme("foo", "en", "Q1860", "Q1084", forms=["foos"])
+    lexeme = LexData.Lexeme(repo, lexeme_id)
+    form = lexeme.forms[0]
+    lexeme["lemmas"]["en"]["value"] = "bar"
+    assert lexeme.save()
+    # The form object isn't part of the lexeme anymore after the save
+    form.add_claims({"P5": ["Q1"]})
+    assert lexeme.changes() == {}
+    assert "P5" in lexeme["forms"][0]["claims"]
+    with repo.edit_queue() as edits:
+        edits.add_claims(form, {"P6": ["Q1"]})
+    assert lexeme.changes() == {}
+    assert not lexeme.save()
+    assert set(store.entities[lexeme_id]["forms"][0]["claims"]) == {"P5", "P6"}
+
+
+def test_create_part_partial(fake):
+    repo, store = fake
+    lexeme_id = store.add_lexeme("foo", "en", "Q1860", "Q1084", forms=["foos"])
+    lexeme = LexData.Lexeme(repo, lexeme_id, props=["lemmas"])
+    form_id = lexeme.create_form("foo", ["Q1"])
+    sense_id = lexeme.create_sense({"en": "foo"})
+    assert [form.id for form in lexeme.forms] == [lexeme_id + "-F1", form_id]
+    assert [sense.id for sense in lexeme.senses] == [sense_id]
+    assert lexeme.changes() == {}
+
+
+def test_lexeme_ref_load(fake):
+    repo, store = fake
+    first = store.add_lexeme("foo", "en", "Q1860", "Q1084")
+    second = store.add_lexeme("bar", "en", "Q1860", "Q1084")
+    a = repo.lexeme_ref(first)
+    b = repo.lexeme_ref(second)
+    a.load()
+    a["lemmas"]["en"]["value"] = "baz"
+    assert b.lemma == "bar"
+    # Resolving the other handles doesn't reset the loaded one
+    assert a.lemma == "baz"
+    assert a.changes() == {"lemmas": {"en": {"language": "en", "value": "baz"}}}
+
+
+def test_create_once(fake, monkeypatch):
+    repo, store = fake
+    en = LexData.language.lang_en
+    created = LexData.get_or_create_lexemes(repo, [("foo", en, "Q1084")] * 2)
+    assert created[("foo", en.qid, "Q1084")].status == "created"
+    assert LexData._create_once(repo, "foo", en, "Q1084")[1] is None
+    assert repo._creating == {}
+
+    def fail(*args):
+        raise PermissionError("API returned error")
+
+    monkeypatch.setattr(LexData, "create_lexeme", fail)
+    with pytest.raises(PermissionError):
+        LexData.get_or_create_lexeme(repo, "bar", en, "Q1084")
+    assert repo._creating == {}
+
+
+def test_edit_queue_local_failure(fake, monkeypatch):
+    repo, store = fake
+    lexeme_id = store.add_lexeme("foo", "en", "Q1860", "Q1084")
+    lexeme = LexData.Lexeme(repo, lexeme_id)
+
+    def fail(*args):
+        raise KeyError("claims")
+
+    monkeypatch.setattr(LexData.Lexeme, "_update_from_answer", fail)
+    with repo.edit_queue() as edits:
+        added = edits.add_claims(lexeme, {"P5": ["Q1"]})
+        form = edits.create_form(lexeme, "foos", ["Q1"])
+    # The edit is saved, although the lexeme couldn't be updated
+    assert added.result() is None
+    assert form.result() == lexeme_id + "-F1"
+    assert "P5" in store.entities[lexeme_id]["claims"]
+
+
+def test_save_languages(fake):
+    repo, store = fake
+    lexeme_id = store.add_lexeme("foo", "en", "Q1860", "Q1084", forms=["foos"])
+    store.entities[lexeme_id]["lemmas"]["nb"] = {"language": "nb", "value": "fu"}
+    lexeme = LexData.Lexeme(repo, lexeme_id, languages=["en"])
+    lexeme["lemmas"]["en"]["value"] = "bar"
+    assert lexeme.save()
+    # The answer of the edit is restricted to the loaded languages as well
+    assert lexeme["lemmas"] == {"en": {"language": "en", "value": "bar"}}
+    assert lexeme.partial
+    assert lexeme.changes() == {}
+    assert store.entities[lexeme_id]["lemmas"]["nb"]["value"] == "fu"
+
+
+def test_save_round_trip(fake):
+    repo, store = fake
+    lexeme_id = store.add_lexeme(
+        "foo", "en", "Q1860", "Q1084", forms=["foos", "fooes"], senses=["a foo"]
+    )
+    lexeme = LexData.Lexeme(repo, lexeme_id)
+    lexeme["lemmas"]["en"]["value"] = "bar"
+    lexeme.forms[0]["representations"]["en"]["value"] = "bars"
+    lexeme.forms.pop()
+    lexeme.senses[0]["glosses"]["en"]["value"] = "a bar"
+    assert lexeme.save()
+    assert lexeme.changes() == {}
+    assert lexeme["lastrevid"] == store.entities[lexeme_id]["lastrevid"]
+    loaded = LexData.Lexeme(repo, lexeme_id)
+    assert loaded.lemma == "bar"
+    assert [form.form for form in loaded.forms] == ["bars"]
+    assert loaded.senses[0].glosse("en") == "a bar"
+    # The other session's edit of the lexeme conflicts with the next one
+    loaded["lemmas"]["en"]["value"] = "baz"
+    assert loaded.save()
+    lexeme["lemmas"]["en"]["value"] = "qux"
+    with pytest.raises(PermissionError):
+        lexeme.save()
+    assert store.entities[lexeme_id]["lemmas"]["en"]["value"] == "baz"
+
+
+def test_edit_queue_ids(fake):
+    repo, store = fake
+    first = LexData.Lexeme(repo, store.add_lexeme("foo", "en", "Q1860", "Q1084"))
+    second = LexData.Lexeme(
+        repo, store.add_lexeme("bar", "en", "Q1860", "Q1084", forms=["bars"])
+    )
+    with repo.edit_queue(workers=2) as edits:
+        futures = [
+            edits.create_form(lexeme, lexeme.lemma + suffix, ["Q1"])
+            for suffix in ("s", "es")
+            for lexeme in (first, second)
+        ]
+        senses = [edits.create_sense(first, {"en": gloss}) for gloss in "ab"]
+    assert [f.result() for f in futures] == [
+        first.id + "-F1",
+        second.id + "-F2",
+        first.id + "-F2",
+        second.id + "-F3",
+    ]
+    assert [f.result() for f in senses] == [first.id + "-S1", first.id + "-S2"]
+    for lexeme in (first, second):
+        stored = {
+            form["id"]: form["representations"]["en"]["value"]
+            for form in store.entities[lexeme.id]["forms"]
+        }
+        assert stored == {form.id: form.form for form in lexeme.forms}
+        assert lexeme.changes() == {}
+    assert [sense.glosse("en") for sense in first.senses] == ["a", "b"]